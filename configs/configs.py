@@ -18,6 +18,8 @@ MEASUREMENTS_DIR = Path(DATA_DIR, "measurements")
 SAVE_DIR = Path(BASE_DIR, "saved")
 SAVE_MERGED_DIR = Path(SAVE_DIR, "merged")
 SAVE_RESULTS_DIR = Path(SAVE_DIR, "results")
+SAVE_CACHE_DIR = Path(SAVE_DIR, "cache")
+SAVE_PIPELINE_CACHE_DIR = Path(SAVE_CACHE_DIR, "pipeline")
 
 # MAKE DIRS
 SAVE_DIR.mkdir(parents=True, exist_ok=True)
@@ -25,6 +27,7 @@ SAVE_DIR.mkdir(parents=True, exist_ok=True)
 # DATA CONFIGS
 CACHING = os.getenv("CACHING", "false") == "true"
 SAVE_COORDS = os.getenv("SAVE_COORDS", "false") == "true"
+CACHING_REFLECTANCES = os.getenv("CACHING_REFLECTANCES", "true") == "true"
 TOML_ENV_NAME = "DATA_TOML_NAME"
 TOML_DEFAULT_FILE_NAME = "clf/_base.toml"
 USE_REDUCED_DATASET = os.getenv("USE_REDUCED_DATASET", "false") == "true"
@@ -79,6 +82,9 @@ CMD_EXECUTE_ALL = "all"
 
 # MATERIALIZER CONFIGS
 MATERIALIZER_DATA_JSON = "structured_data.json"
+MATERIALIZER_DATA_PARQUET = "data.parquet"
+MATERIALIZER_META_PARQUET = "meta.parquet"
+MATERIALIZER_TARGET_PARQUET = "target.parquet"
 MATERIALIZER_DESCRIBE_DATA_CSV = "describe_data.csv"
 MATERIALIZER_DESCRIBE_META_CSV = "describe_meta.csv"
 MATERIALIZER_DESCRIBE_TARGET_CSV = "describe_target.csv"
@@ -93,6 +99,15 @@ DB_PREDICTIONS_TRAIN = TRAIN_STR
 DB_PREDICTIONS_TEST = TEST_STR
 DB_CV_METRIC_NAME = "cv_metric"
 
+# OPTUNA CONFIGS
+STUDY_STORAGE_SQLITE = "sqlite"
+STUDY_STORAGE_JOURNAL = "journal"
+STUDY_STORAGE_MEMORY = "memory"
+STUDY_JOURNAL_PATH = Path(SAVE_DIR, os.getenv("STUDY_JOURNAL_NAME", "optuna_journal.log"))
+STUDY_WORKER_DIR = Path(SAVE_CACHE_DIR, "studies")
+TRIAL_EXECUTOR_THREAD = "thread"
+TRIAL_EXECUTOR_PROCESS = "process"
+
 # SPECTRAL BANDS
 BAND_BLUE = "blue"
 BAND_GREEN = "green"
@@ -108,3 +123,7 @@ BAND_RED_EDGE_S2 = "RE2"
 BAND_RED_EDGE_S3 = "RE3"
 BAND_NIR_S1 = "N"
 BAND_NIR_S2 = "N2"
+
+# SPECTRAL INDICES
+# rows processed at once when computing spectral indices, bounds memory for large inputs
+INDICES_CHUNK_SIZE = 2**18
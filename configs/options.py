@@ -1,3 +1,4 @@
+from optuna import pruners
 from sklearn import model_selection
 from sklearn.decomposition import PCA
 from sklearn.dummy import DummyClassifier, DummyRegressor
@@ -39,6 +40,12 @@ VALIDATORS = {
     "RepeatedKFold": model_selection.RepeatedKFold,
 }
 
+PRUNERS = {
+    "MedianPruner": pruners.MedianPruner,
+    "HyperbandPruner": pruners.HyperbandPruner,
+    "SuccessiveHalvingPruner": pruners.SuccessiveHalvingPruner,
+}
+
 METHODS = {
     "SVC": SVC,
     "SVR": SVR,
@@ -16,6 +16,12 @@ TYPE_DICT_TUPL = dict[str, tuple[str, str]]
 
 class GeneralConfig(BaseModel):
     raster_num_closest_points: int
+    raster_engine: str = "brute"
+    raster_shared_geometry: bool = False
+    raster_n_jobs: int = 1
+    raster_backend: str = "threads"
+    raster_lazy: bool = False
+    raster_chunks: int | None = None
     dates: list[str]
     treatments: list[str]
     varieties: list[str] | None
@@ -51,6 +57,8 @@ class SamplerConfig(BaseModel):
 class FeaturesConfig(BaseModel):
     features_engineer: str = None
     feateng_steps: int = 1
+    max_features: int = None  # upper bound of features generated by autofeat, reduces 'feateng_steps'
+    max_gb: float = None  # memory limit of autofeat, data is subsampled to fit
     verbose: int = 0
     n_jobs: int = 1
 
@@ -78,6 +86,8 @@ class FormatterConfig(BaseModel):
 class ModelConfig(BaseModel):
     pipeline: list[str]
     unions: dict[str, list[str]] = {}
+    # fitted transformers are kept in SAVE_PIPELINE_CACHE_DIR, which is never cleared
+    cache_transformers: bool = False
 
 
 class TunedParametersConfig(BaseModel):
@@ -98,14 +108,44 @@ class ValidatorConfig(BaseModel):
         return dict_
 
 
+class PrunerConfig(BaseModel):
+    pruner: str
+    # parameters are passed only if set, because each pruner accepts different ones
+    n_startup_trials: int = None
+    n_warmup_steps: int = None
+    min_resource: int = None
+    max_resource: int = None
+    reduction_factor: int = None
+
+    def params(self):
+        dict_ = self.dict(exclude_none=True)
+        dict_.pop("pruner", None)
+        return dict_
+
+
+class MultiFidelityConfig(BaseModel):
+    parameter: str  # number of boosting rounds of the last pipeline step, e.g. XGBClassifier__n_estimators
+    min_resource: int
+    reduction_factor: int = 3
+
+
 class OptimizerConfig(BaseModel):
     tuned_parameters: TunedParametersConfig
     validator: ValidatorConfig
+    pruner: PrunerConfig = None  # folds are scored one by one and unpromising trials are stopped
+    multi_fidelity: MultiFidelityConfig = None  # boosting rounds are trained incrementally instead
     n_trials: int
     scoring_metric: str
     scoring_mode: str
-    n_jobs: int = 1
+    n_jobs: int = 1  # parallel trials
+    executor: str = configs.TRIAL_EXECUTOR_THREAD  # trials run in threads or processes
+    fold_n_jobs: int = 1  # parallel folds of a trial, used only without pruning
+    n_cores: int = None  # cores shared by trials, folds and models, all available if not set
     timeout: int = None
+    storage: str = (
+        configs.STUDY_STORAGE_SQLITE
+    )  # sqlite, journal (for workers in several processes) or memory
+    study_name: str = None  # existing study is continued if set
 
 
 class RegistryConfig(BaseModel):
@@ -1,19 +1,78 @@
+import logging
+from contextlib import contextmanager
 from typing import Literal, Union
 
 import numpy as np
 import pandas as pd
 from autofeat import AutoFeatClassifier, AutoFeatRegressor
+from autofeat.feateng import n_cols_generated
+from joblib import parallel_backend, register_parallel_backend
+from joblib._parallel_backends import LokyBackend
 from sklearn.base import BaseEstimator, TransformerMixin
 
 from configs import configs
-from utils.tools import compute_indices, feature_selector_factory
+from utils.tools import compute_indices, feature_selector_factory, get_spectral_indices_engine
 from utils.utils import set_random_seed
 
+AUTOFEAT_BACKEND = "autofeat_loky"
+
+
+def budget_feateng_steps(
+    n_features: int, feateng_steps: int, n_transformations: int, max_features: int | None
+) -> int:
+    # reduce feature engineering steps, so the upper bound of generated features stays within the budget
+    if max_features is None:
+        return feateng_steps
+    steps = feateng_steps
+    while steps > 1 and n_cols_generated(n_features, steps, n_transformations) > max_features:
+        steps -= 1
+    if steps != feateng_steps:
+        logging.warning(
+            f"Feature engineering steps reduced from {feateng_steps} to {steps}, "
+            f"to generate at most {max_features} features."
+        )
+    return steps
+
+
+class DeterministicLokyBackend(LokyBackend):
+    # autofeat orders candidate features through sets of strings, so workers use fixed hashing
+    # to make parallel feature selection reproducible between runs
+    def _prepare_worker_env(self, n_jobs):
+        env = super()._prepare_worker_env(n_jobs)
+        env["PYTHONHASHSEED"] = str(configs.RANDOM_SEED)
+        return env
+
+
+register_parallel_backend(AUTOFEAT_BACKEND, DeterministicLokyBackend)
+
+
+@contextmanager
+def autofeat_fit_context(model: Union["AutoFeatClassification", "AutoFeatRegression"], n_features: int):
+    feateng_steps = model.feateng_steps
+    model.feateng_steps = budget_feateng_steps(
+        n_features, feateng_steps, len(model.transformations), model.max_features
+    )
+    try:
+        with parallel_backend(AUTOFEAT_BACKEND):
+            yield
+    finally:
+        model.feateng_steps = feateng_steps
+
 
 class AutoFeatClassification(AutoFeatClassifier):
-    def __init__(self, verbose: int = 0, feateng_steps: int = 1, **kwargs):
+    def __init__(
+        self,
+        verbose: int = 0,
+        feateng_steps: int = 1,
+        n_jobs: int = 1,
+        max_features: int = None,
+        max_gb: float = None,
+        **kwargs,
+    ):
         set_random_seed(configs.RANDOM_SEED)
-        super().__init__(verbose=verbose, feateng_steps=feateng_steps, n_jobs=1)
+        # parallel feature selection runs are seeded by autofeat (see also 'DeterministicLokyBackend')
+        super().__init__(verbose=verbose, feateng_steps=feateng_steps, n_jobs=n_jobs, max_gb=max_gb)
+        self.max_features = max_features
 
     def fit(self, data: pd.DataFrame, target: pd.Series):
         set_random_seed(configs.RANDOM_SEED)
@@ -27,15 +86,26 @@ class AutoFeatClassification(AutoFeatClassifier):
 
     def fit_transform(self, data: pd.DataFrame, target: pd.Series):
         set_random_seed(configs.RANDOM_SEED)
-        data_transformed = super().fit_transform(data, target)
+        with autofeat_fit_context(self, data.shape[1]):
+            data_transformed = super().fit_transform(data, target)
         data_transformed.index = data.index
         return data_transformed
 
 
 class AutoFeatRegression(AutoFeatRegressor):
-    def __init__(self, verbose: int = 0, feateng_steps: int = 1, **kwargs):
+    def __init__(
+        self,
+        verbose: int = 0,
+        feateng_steps: int = 1,
+        n_jobs: int = 1,
+        max_features: int = None,
+        max_gb: float = None,
+        **kwargs,
+    ):
         set_random_seed(configs.RANDOM_SEED)
-        super().__init__(verbose=verbose, feateng_steps=feateng_steps, n_jobs=1)
+        # parallel feature selection runs are seeded by autofeat (see also 'DeterministicLokyBackend')
+        super().__init__(verbose=verbose, feateng_steps=feateng_steps, n_jobs=n_jobs, max_gb=max_gb)
+        self.max_features = max_features
 
     def fit(self, data: pd.DataFrame, target: pd.Series):
         set_random_seed(configs.RANDOM_SEED)
@@ -49,7 +119,8 @@ class AutoFeatRegression(AutoFeatRegressor):
 
     def fit_transform(self, data: pd.DataFrame, target: pd.Series):
         set_random_seed(configs.RANDOM_SEED)
-        data_transformed = super().fit_transform(data, target)
+        with autofeat_fit_context(self, data.shape[1]):
+            data_transformed = super().fit_transform(data, target)
         data_transformed.index = data.index
         return data_transformed
 
@@ -82,6 +153,9 @@ class AutoSpectralIndices(BaseEstimator, TransformerMixin):
     def fit(self, data: pd.DataFrame, target: pd.Series) -> BaseEstimator:
         df_indices = compute_indices(data)
         self.selector.fit(df_indices, target)
+        # names, because 'compute_indices' drops different columns depending on the data
+        columns_select_idx = list(self.selector[1].k_feature_idx_)
+        self.selected_indices_ = df_indices.columns[columns_select_idx].tolist()
         return self
         """ -- Check plot: performance vs number of features --
         import matplotlib.pyplot as plt
@@ -92,9 +166,15 @@ class AutoSpectralIndices(BaseEstimator, TransformerMixin):
         """
 
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
-        df_indices = compute_indices(data)
-        columns_select_idx = list(self.selector[1].k_feature_idx_)
-        df_indices = df_indices.iloc[:, columns_select_idx]
+        if hasattr(self, "selected_indices_"):
+            # only selected indices are computed
+            engine = get_spectral_indices_engine(tuple(self.selected_indices_))
+            df_indices = engine.compute(data, chunk_size=configs.INDICES_CHUNK_SIZE)
+        else:
+            # models pickled before names of selected indices were stored (raises if not fitted)
+            df_indices = compute_indices(data)
+            columns_select_idx = list(self.selector[1].k_feature_idx_)
+            df_indices = df_indices.iloc[:, columns_select_idx]
         if self.merge_with_original:
             return pd.concat([data, df_indices], axis=1)
         return df_indices
@@ -162,26 +242,30 @@ class AutoSpectralIndicesPlusGenerated(BaseEstimator, TransformerMixin):
             f")"
         )
 
-    def _correlation_analysis(self, data: pd.DataFrame):
+    def _correlation_analysis(self, df_merged: pd.DataFrame):
         # Remove highly correlated features
-        # Transform data
-        df_generated = self.selector_generated.transform(data)
-        df_spectral_indices = self.selector_spectral_indices.transform(data)
-        df_merged = pd.concat([df_generated, df_spectral_indices], axis=1)
-        # Calculate correlation between features
-        correlation_matrix = df_merged.corr().abs()
-        upper_triangle = correlation_matrix.where(
-            np.triu(np.ones(correlation_matrix.shape), k=1).astype(np.bool_)
+        values = df_merged.to_numpy(dtype=np.float32)
+        std = values.std(axis=0)
+        # Standardise columns, constant columns are not correlated with any other column
+        standardized = np.divide(
+            values - values.mean(axis=0), std, out=np.zeros_like(values), where=std > 0
         )
-        # Select columns with correlation greater than 0.99
-        self.columns_to_drop = [
-            column for column in upper_triangle.columns if any(upper_triangle[column] > 0.99)
-        ]
+        # Calculate correlation between features
+        correlation_matrix = np.abs(standardized.T @ standardized) / max(len(values), 1)
+        # Select columns with correlation greater than 0.99 with any previous column
+        to_drop = np.triu(correlation_matrix > 0.99, k=1).any(axis=0)
+        self.columns_to_drop = df_merged.columns[to_drop].tolist()
+
+    def _fit(self, data: pd.DataFrame, target: pd.Series) -> pd.DataFrame:
+        # transformed training data is reused for the correlation analysis and by 'fit_transform'
+        df_generated = self.selector_generated.fit_transform(data, target)
+        df_spectral_indices = self.selector_spectral_indices.fit_transform(data, target)
+        df_merged = pd.concat([df_generated, df_spectral_indices], axis=1)
+        self._correlation_analysis(df_merged)
+        return df_merged
 
     def fit(self, data: pd.DataFrame, target: pd.Series) -> BaseEstimator:
-        self.selector_generated.fit(data, target)
-        self.selector_spectral_indices.fit(data, target)
-        self._correlation_analysis(data)
+        self._fit(data, target)
         return self
 
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
@@ -192,20 +276,36 @@ class AutoSpectralIndicesPlusGenerated(BaseEstimator, TransformerMixin):
         return df_merged
 
     def fit_transform(self, data: pd.DataFrame, target: pd.Series) -> pd.DataFrame:
-        self.fit(data, target)
-        return self.transform(data)
+        df_merged = self._fit(data, target)
+        return df_merged.drop(columns=self.columns_to_drop)
 
 
 class AutoSpectralIndicesPlusGeneratedClassification(AutoSpectralIndicesPlusGenerated):
-    def __init__(self, verbose: int = 0, n_jobs=1, feateng_steps: int = 1, **kwargs):
+    def __init__(
+        self,
+        verbose: int = 0,
+        n_jobs=1,
+        feateng_steps: int = 1,
+        max_features: int = None,
+        max_gb: float = None,
+        **kwargs,
+    ):
         self.verbose = verbose
         self.n_jobs = n_jobs
         self.feateng_steps = feateng_steps
+        self.max_features = max_features
+        self.max_gb = max_gb
 
         selector_spectral_indices = AutoSpectralIndicesClassification(
             verbose=verbose, n_jobs=n_jobs, merge_with_original=False
         )
-        selector_generated = AutoFeatClassification(verbose=verbose, feateng_steps=feateng_steps)
+        selector_generated = AutoFeatClassification(
+            verbose=verbose,
+            feateng_steps=feateng_steps,
+            n_jobs=n_jobs,
+            max_features=max_features,
+            max_gb=max_gb,
+        )
         super().__init__(
             selector_spectral_indices=selector_spectral_indices,
             selector_generated=selector_generated,
@@ -214,20 +314,37 @@ class AutoSpectralIndicesPlusGeneratedClassification(AutoSpectralIndicesPlusGene
     def __repr__(self) -> str:
         return (
             f"{self.__class__.__name__}(verbose={self.verbose}, "
-            f"n_jobs={self.n_jobs}, feateng_steps={self.feateng_steps})"
+            f"n_jobs={self.n_jobs}, feateng_steps={self.feateng_steps}, "
+            f"max_features={self.max_features}, max_gb={self.max_gb})"
         )
 
 
 class AutoSpectralIndicesPlusGeneratedRegression(AutoSpectralIndicesPlusGenerated):
-    def __init__(self, verbose: int = 0, n_jobs=1, feateng_steps: int = 1, **kwargs):
+    def __init__(
+        self,
+        verbose: int = 0,
+        n_jobs=1,
+        feateng_steps: int = 1,
+        max_features: int = None,
+        max_gb: float = None,
+        **kwargs,
+    ):
         self.verbose = verbose
         self.n_jobs = n_jobs
         self.feateng_steps = feateng_steps
+        self.max_features = max_features
+        self.max_gb = max_gb
 
         selector_spectral_indices = AutoSpectralIndicesRegression(
             verbose=verbose, n_jobs=n_jobs, merge_with_original=False
         )
-        selector_generated = AutoFeatRegression(verbose=verbose, feateng_steps=feateng_steps)
+        selector_generated = AutoFeatRegression(
+            verbose=verbose,
+            feateng_steps=feateng_steps,
+            n_jobs=n_jobs,
+            max_features=max_features,
+            max_gb=max_gb,
+        )
         super().__init__(
             selector_spectral_indices=selector_spectral_indices,
             selector_generated=selector_generated,
@@ -236,7 +353,8 @@ class AutoSpectralIndicesPlusGeneratedRegression(AutoSpectralIndicesPlusGenerate
     def __repr__(self) -> str:
         return (
             f"{self.__class__.__name__}(verbose={self.verbose}, "
-            f"n_jobs={self.n_jobs}, feateng_steps={self.feateng_steps})"
+            f"n_jobs={self.n_jobs}, feateng_steps={self.feateng_steps}, "
+            f"max_features={self.max_features}, max_gb={self.max_gb})"
         )
 
 
@@ -45,7 +45,11 @@ class Formatter(ABC):
             & data.meta[configs.TREATMENT_ENG].isin(self.general_cfg.treatments)
             & data.meta[configs.DATE_ENG].isin(self.general_cfg.dates)
         ].to_list()
-        return data[indices].reset_index()
+        data = data[indices].reset_index()
+        # drop categories of filtered out rows, so they do not appear in groupings and plots
+        categorical = data.meta.select_dtypes("category").columns
+        data.meta[categorical] = data.meta[categorical].apply(lambda x: x.cat.remove_unused_categories())
+        return data
 
     def _modify_data(self, data: StructuredData) -> StructuredData:
         if self.formatter_cfg.date_as_feature:
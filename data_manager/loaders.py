@@ -1,5 +1,6 @@
 from itertools import product
 
+import numpy as np
 import pandas as pd
 
 from configs import configs
@@ -19,10 +20,18 @@ class MultispectralLoader:
         save_dir="saved",
         save_coords=False,
         use_reduced_dataset=False,
+        cache_dir=None,
     ):
         self.save_dir = save_dir
+        self.cache_dir = cache_dir
         self.save_coords = save_coords
         self.num_closest_points = general_config.raster_num_closest_points
+        self.raster_engine = general_config.raster_engine
+        self.raster_shared_geometry = general_config.raster_shared_geometry
+        self.raster_n_jobs = general_config.raster_n_jobs
+        self.raster_backend = general_config.raster_backend
+        self.raster_lazy = general_config.raster_lazy
+        self.raster_chunks = general_config.raster_chunks
         self.use_reduced_dataset = use_reduced_dataset
 
         self.rasters_paths, self.shapefiles_paths = multispectral_config.parse_specific_paths()
@@ -54,7 +63,7 @@ class MultispectralLoader:
         if self._mergers is None:
             raise ValueError("Mergers are not loaded.")
         self._multi_merger = MultiRasterPointsMerger(self._mergers)
-        self._multi_merger.run_merges()
+        self._multi_merger.run_merges(n_jobs=self.raster_n_jobs, backend=self.raster_backend)
 
     def final_merge(self):
         columns_slo = [configs.BLOCK_SLO, configs.PLANT_SLO, configs.VARIETY_SLO]
@@ -62,19 +71,22 @@ class MultispectralLoader:
         columns_meta = columns_slo + [configs.TREATMENT_ENG, configs.DATE_ENG]
         columns_data = self.channels
 
-        df_meta_merged = pd.DataFrame(columns=columns_meta)
-        df_data_merged = pd.DataFrame(columns=columns_data)
-
+        dfs_data = []
+        dfs_meta = []
         for merged_df in self.merged_dfs:
             df_data, treatment, date = self._extract_data(merged_df)
             df_meta = self._extract_meta(merged_df, treatment, date, columns_meta)
-            df_data_merged = pd.concat([df_data_merged, df_data], axis=0)
-            df_meta_merged = pd.concat([df_meta_merged, df_meta], axis=0)
+            dfs_data.append(df_data)
+            dfs_meta.append(df_meta)
+
+        # concatenated once (linear cost), reflectances as float32 and metadata as categorical
+        df_data_merged = pd.concat(dfs_data, axis=0, ignore_index=True)
+        df_data_merged = df_data_merged[columns_data].astype(np.float32)
+        df_meta_merged = pd.concat(dfs_meta, axis=0, ignore_index=True)
+        df_meta_merged = df_meta_merged[columns_meta].astype("category")
 
         columns = {old_name: new_name for old_name, new_name in zip(columns_slo, columns_eng)}
         df_meta_merged.rename(columns=columns, inplace=True, errors="raise")
-        df_data_merged.reset_index(drop=True, inplace=True)
-        df_meta_merged.reset_index(drop=True, inplace=True)
         self._structured_data = StructuredData(data=df_data_merged, meta=df_meta_merged)
 
     def _extract_data(self, merged_df):
@@ -85,17 +97,14 @@ class MultispectralLoader:
         return df_data, treatment, date
 
     def _extract_meta(self, merged_df, treatment, date, columns_meta):
-        merged_df[[configs.TREATMENT_ENG, configs.DATE_ENG]] = [
-            treatment,
-            date,
-        ]
         df_meta = merged_df.loc[:, merged_df.columns.isin(columns_meta)]
+        df_meta = df_meta.assign(**{configs.TREATMENT_ENG: treatment, configs.DATE_ENG: date})
         return df_meta
 
     def _create_merger(self, date, treatment, channels, location_type):
         base_path = self.rasters_paths[treatment][date]
         paths = {channel: base_path[channel] for channel in channels}
-        raster = MultiGeotiffRaster.from_paths(paths)
+        raster = MultiGeotiffRaster.from_paths(paths, lazy=self.raster_lazy, chunks=self.raster_chunks)
         raster.set_name("".join([treatment, "__", date]))
         path_shape = self.shapefiles_paths[treatment][location_type]
         shapefile = PointsShapefile.from_path(path_shape)
@@ -106,6 +115,9 @@ class MultispectralLoader:
             save_coords=self.save_coords,
             num_closest_points=self.num_closest_points,
             use_reduced_dataset=self.use_reduced_dataset,
+            engine=self.raster_engine,
+            shared_geometry=self.raster_shared_geometry,
+            cache_dir=self.cache_dir,
         )
 
     @property
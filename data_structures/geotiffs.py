@@ -9,9 +9,12 @@ class GeotiffRaster:
     Y = "y"
     DATA_COLUMN_NAME = "reflectance"
 
-    def __init__(self, raster: DataArray, *, name=None):
+    def __init__(self, raster: DataArray, *, name=None, lazy=False, chunks=None):
         self._raster = raster
         self._name = name if name is not None else self.DATA_COLUMN_NAME
+        # options the raster was opened with, used to reopen it after unpickling
+        self.lazy = lazy
+        self.chunks = chunks
 
     def __str__(self):
         return f"<GeotiffRaster(shape={self.shape}, name={self.name})>"
@@ -19,22 +22,36 @@ class GeotiffRaster:
     def __len__(self):
         return len(self._raster)
 
+    def __getstate__(self):
+        # opened files can not be pickled (e.g. sent to worker processes), the raster is reopened from its path
+        return {"path": self.path, "name": self._name, "lazy": self.lazy, "chunks": self.chunks}
+
+    def __setstate__(self, state):
+        raster = self._init_geotiff_raster(state["path"], lazy=state["lazy"], chunks=state["chunks"])
+        self.__init__(raster, name=state["name"], lazy=state["lazy"], chunks=state["chunks"])
+
     @staticmethod
-    def _init_geotiff_raster(file_path):
-        raster = open_rasterio(file_path)
+    def _init_geotiff_raster(file_path, lazy=False, chunks=None):
+        # lazy: decoded data is not cached in memory, so only the windows that are read get decoded
+        # chunks: raster is backed by dask (must be installed) and decoded chunk by chunk
+        raster = open_rasterio(file_path, cache=not lazy, chunks=chunks)
         raster = raster.squeeze().drop("spatial_ref").drop("band")
         raster.name = GeotiffRaster.DATA_COLUMN_NAME
         return raster
 
     @classmethod
-    def from_path(cls, file_path, name=""):
-        raster = cls._init_geotiff_raster(file_path)
-        return cls(raster, name=name)
+    def from_path(cls, file_path, name="", lazy=False, chunks=None):
+        raster = cls._init_geotiff_raster(file_path, lazy=lazy, chunks=chunks)
+        return cls(raster, name=name, lazy=lazy, chunks=chunks)
 
-    def to_numpy(self, set_nodata_to_zero=True):
+    def to_numpy(self, set_nodata_to_zero=True, inplace=False):
         array = self._raster.to_numpy()
         if set_nodata_to_zero:
-            array[np.where(array == self.nodata)] = 0
+            if inplace:
+                # no copy is made, but data cached in memory (if not lazy) is modified as well
+                array[array == self.nodata] = 0
+            else:
+                array = np.where(array == self.nodata, 0, array)
         return array
 
     def to_pandas(self):
@@ -42,6 +59,29 @@ class GeotiffRaster:
         df = df[df[self.DATA_COLUMN_NAME] != self.nodata]
         return df.reset_index(drop=True)
 
+    def valid_mask(self, array):
+        return array != self.nodata
+
+    def read_window(self, row_start, row_stop, col_start, col_stop):
+        window = self._raster.isel(
+            {self.Y: slice(row_start, row_stop), self.X: slice(col_start, col_stop)}
+        )
+        return window.to_numpy()
+
+    def index(self, xs, ys):
+        # fractional (row, col) positions of coordinates, computed from the affine transform
+        inverse = ~self.transform
+        cols = inverse.a * xs + inverse.b * ys + inverse.c
+        rows = inverse.d * xs + inverse.e * ys + inverse.f
+        return rows, cols
+
+    def xy(self, rows, cols):
+        # coordinates of pixel centres, computed from the affine transform
+        transform = self.transform
+        xs = transform.a * (cols + 0.5) + transform.b * (rows + 0.5) + transform.c
+        ys = transform.d * (cols + 0.5) + transform.e * (rows + 0.5) + transform.f
+        return xs, ys
+
     @property
     def nodata(self):
         return self._raster._FillValue
@@ -62,6 +102,22 @@ class GeotiffRaster:
     def shape(self):
         return self._raster.shape
 
+    @property
+    def transform(self):
+        return self._raster.rio.transform()
+
+    @property
+    def crs(self):
+        return self._raster.rio.crs
+
+    @property
+    def dtype(self):
+        return self._raster.dtype
+
+    @property
+    def resolution(self):
+        return self._raster.rio.resolution()
+
 
 class MultiGeotiffRaster:
     def __init__(self, rasters: list[GeotiffRaster] = None):
@@ -78,19 +134,19 @@ class MultiGeotiffRaster:
         return self._rasters[index]
 
     @staticmethod
-    def _from_paths_dict(file_paths: dict[str, str]):
-        return [GeotiffRaster.from_path(path, name) for name, path in file_paths.items()]
+    def _from_paths_dict(file_paths: dict[str, str], **kwargs):
+        return [GeotiffRaster.from_path(path, name, **kwargs) for name, path in file_paths.items()]
 
     @staticmethod
-    def _from_paths_list(file_paths: list[str]):
-        return [GeotiffRaster.from_path(path) for path in file_paths]
+    def _from_paths_list(file_paths: list[str], **kwargs):
+        return [GeotiffRaster.from_path(path, **kwargs) for path in file_paths]
 
     @classmethod
-    def from_paths(cls, file_paths: list[str] | dict[str, str]):
+    def from_paths(cls, file_paths: list[str] | dict[str, str], lazy=False, chunks=None):
         if isinstance(file_paths, dict):
-            rasters = cls._from_paths_dict(file_paths)
+            rasters = cls._from_paths_dict(file_paths, lazy=lazy, chunks=chunks)
         elif isinstance(file_paths, list):
-            rasters = cls._from_paths_list(file_paths)
+            rasters = cls._from_paths_list(file_paths, lazy=lazy, chunks=chunks)
         else:
             raise ValueError(f"Invalid type: {type(file_paths)}")
         return cls(rasters)
@@ -98,6 +154,42 @@ class MultiGeotiffRaster:
     def set_name(self, name):
         self._name = name
 
+    def validate_grids(self):
+        # all rasters must share the same grid to be indexed with the same (row, col) positions
+        reference = self._rasters[0]
+        for raster in self._rasters[1:]:
+            if (raster.shape, raster.transform, raster.crs) != (
+                reference.shape,
+                reference.transform,
+                reference.crs,
+            ):
+                raise ValueError(
+                    f"Rasters '{reference.name}' and '{raster.name}' of '{self.name}' do not share the same grid."
+                )
+
+    def to_numpy(self, set_nodata_to_zero=True):
+        # filled band by band, so only one extra band is held in memory at a time
+        dtype = np.result_type(*[raster.dtype for raster in self._rasters])
+        array = np.empty((len(self._rasters), *self.shape), dtype=dtype)
+        for band, raster in zip(array, self._rasters):
+            band[...] = raster.to_numpy(set_nodata_to_zero)
+        return array
+
+    def valid_mask(self, array):
+        # one mask per raster, rasters may have different nodata footprints (e.g. at field edges)
+        return np.stack([raster.valid_mask(band) for raster, band in zip(self._rasters, array)])
+
+    def read_window(self, row_start, row_stop, col_start, col_stop):
+        return np.stack(
+            [raster.read_window(row_start, row_stop, col_start, col_stop) for raster in self._rasters]
+        )
+
+    def index(self, xs, ys):
+        return self._rasters[0].index(xs, ys)
+
+    def xy(self, rows, cols):
+        return self._rasters[0].xy(rows, cols)
+
     @property
     def name(self):
         return self._name
@@ -110,6 +202,14 @@ class MultiGeotiffRaster:
     def channels(self):
         return [raster.name for raster in self._rasters]
 
+    @property
+    def shape(self):
+        return self._rasters[0].shape
+
+    @property
+    def resolution(self):
+        return self._rasters[0].resolution
+
 
 if __name__ == "__main__":
     from configs import paths
@@ -1,14 +1,25 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 from rich.progress import track
-from scipy.spatial import distance
+from scipy.spatial import cKDTree, distance
 
 from data_structures.geotiffs import GeotiffRaster, MultiGeotiffRaster
 from data_structures.shapefiles import PointsShapefile
-from utils.utils import ensure_dir
+from utils.utils import ensure_dir, hash_files
 
 
 class RasterPointsMerger:
+    ENGINE_BRUTE = "brute"
+    ENGINE_KDTREE = "kdtree"
+    ENGINE_GRID = "grid"
+    ENGINES = (ENGINE_BRUTE, ENGINE_KDTREE, ENGINE_GRID)
+
     def __init__(
         self,
         rasters: MultiGeotiffRaster,
@@ -18,7 +29,14 @@ class RasterPointsMerger:
         save_coords=False,
         num_closest_points=1,
         use_reduced_dataset=False,
+        engine=ENGINE_BRUTE,
+        shared_geometry=False,
+        show_progress=True,
+        cache_dir=None,
     ):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Invalid engine: {engine}, possible values are: {self.ENGINES}")
+
         self._rasters = rasters
         self._shapefile = shapefile
 
@@ -30,6 +48,10 @@ class RasterPointsMerger:
         self.save_coords = save_coords
         self.num_closest_points = num_closest_points
         self.use_reduced_dataset = use_reduced_dataset
+        self.engine = engine
+        self.shared_geometry = shared_geometry
+        self.show_progress = show_progress
+        self.cache_dir = cache_dir
 
     def run_merge(self):
         if self.use_reduced_dataset:
@@ -38,6 +60,32 @@ class RasterPointsMerger:
         else:
             self._merged_df = self._shapefile.to_pandas()
 
+        # coordinates of closest points are saved only when reflectances are actually extracted
+        cache_path = None if self.cache_dir is None or self.save_coords else self._cache_path()
+        if cache_path is not None and cache_path.exists():
+            reflectances_df = pd.read_parquet(cache_path)
+            for channel in self.rasters_channels:
+                self._merged_df[channel] = reflectances_df[channel].to_numpy()
+            return self._merged_df
+
+        self._merge_reflectances()
+
+        if cache_path is not None:
+            self._save_cache(cache_path)
+        return self._merged_df
+
+    def _merge_reflectances(self):
+        if self.shared_geometry and self._has_shared_grid():
+            reflectances = self._extract_reflectances_shared(
+                self._rasters,
+                self._merged_df,
+                n_closest=self.num_closest_points,
+                save_coords=self.save_coords,
+            )
+            for channel, reflectance_list in zip(self._rasters.channels, reflectances):
+                self._merged_df[channel] = reflectance_list
+            return
+
         for raster in self._rasters:
             reflectance_list = self._extract_reflectances(
                 raster,
@@ -46,7 +94,40 @@ class RasterPointsMerger:
                 save_coords=self.save_coords,
             )
             self._merged_df[raster.name] = reflectance_list
-        return self._merged_df
+
+    def _has_shared_grid(self):
+        try:
+            self._rasters.validate_grids()
+        except ValueError as e:
+            logging.warning(f"{e} Reflectances are extracted for each channel separately.")
+            return False
+        return True
+
+    def _cache_key(self):
+        # rasters are identified by path, modification time and size, shapefiles by content
+        rasters = [
+            [channel, str(path), path.stat().st_mtime_ns, path.stat().st_size]
+            for channel, path in zip(self.rasters_channels, self.rasters_paths)
+        ]
+        shapefile_path = Path(self.shapefile_path)
+        shapefile_files = sorted(shapefile_path.parent.glob(f"{shapefile_path.stem}.*"))
+        fingerprint = {
+            "rasters": rasters,
+            "shapefile": hash_files(shapefile_files),
+            "num_closest_points": self.num_closest_points,
+            "use_reduced_dataset": self.use_reduced_dataset,
+            "shared_geometry": self.shared_geometry,
+        }
+        return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()
+
+    def _cache_path(self):
+        return Path(self.cache_dir, f"{self.rasters_name}__{self._cache_key()}.parquet")
+
+    def _save_cache(self, cache_path: Path):
+        # written to a temporary file first, so that interrupted runs do not leave broken cache entries
+        temp_path = ensure_dir(cache_path.parent) / f"{cache_path.name}.tmp"
+        self._merged_df[self.rasters_channels].to_parquet(temp_path, index=False)
+        temp_path.replace(cache_path)
 
     def _extract_reflectances(
         self,
@@ -55,15 +136,106 @@ class RasterPointsMerger:
         n_closest=1,
         save_coords=False,
     ):
-        raster_df = raster.to_pandas()
-        coordinates = raster_df[[raster.X, raster.Y]].to_numpy()
-        reflectances = raster_df[[raster.DATA_COLUMN_NAME]].to_numpy()
+        if self.engine == self.ENGINE_GRID:
+            reflectances, coordinates_lists = self._extract_reflectances_grid(
+                raster, shapefile_df, n_closest=n_closest
+            )
+            reflectance_list, coordinates_list = reflectances[0], coordinates_lists[0]
+        else:
+            raster_df = raster.to_pandas()
+            coordinates = raster_df[[raster.X, raster.Y]].to_numpy()
+            reflectances = raster_df[[raster.DATA_COLUMN_NAME]].to_numpy()
+
+            if self.engine == self.ENGINE_KDTREE:
+                points = shapefile_df[[self.shapefile_X, self.shapefile_Y]].to_numpy().astype(float)
+                n_closest_indices = self._get_closest_kdtree_indices(
+                    coordinates, points, n_closest=n_closest
+                )
+                reflectance_list = reflectances[n_closest_indices, 0].mean(axis=1)
+                coordinates_list = list(coordinates[n_closest_indices])
+            else:
+                reflectance_list, coordinates_list = self._extract_reflectances_brute(
+                    raster, shapefile_df, coordinates, reflectances, n_closest=n_closest
+                )
+
+        if save_coords:
+            self._save_coords(coordinates_list, save_name=raster.name)
+
+        return reflectance_list
+
+    def _extract_reflectances_shared(
+        self,
+        rasters: MultiGeotiffRaster,
+        shapefile_df: pd.DataFrame,
+        n_closest=1,
+        save_coords=False,
+    ):
+        # neighbours are searched once for each distinct nodata footprint (usually shared by all channels),
+        # so every channel gets exactly the pixels it would get when extracted separately
+        if self.engine == self.ENGINE_GRID:
+            reflectances, coordinates_lists = self._extract_reflectances_grid(
+                rasters, shapefile_df, n_closest=n_closest
+            )
+        else:
+            bands = rasters.to_numpy(set_nodata_to_zero=False)
+            masks = rasters.valid_mask(bands)
+            points = shapefile_df[[self.shapefile_X, self.shapefile_Y]].to_numpy().astype(float)
+            reflectances = np.empty((len(bands), len(points)), dtype=bands.dtype)
+            coordinates_lists = [None] * len(bands)
+
+            for group in self._group_equal_masks(masks):
+                rows, cols = np.nonzero(masks[group[0]])
+                coordinates = np.stack(rasters.xy(rows, cols), axis=1)
+                if self.engine == self.ENGINE_KDTREE:
+                    n_closest_indices = self._get_closest_kdtree_indices(
+                        coordinates, points, n_closest=n_closest
+                    )
+                else:
+                    n_closest_indices = np.stack(
+                        [
+                            self._get_closest_distance_indices(
+                                coordinates, point[None], n_closest=n_closest
+                            )
+                            for point in track(
+                                points,
+                                description=f"Extracting reflectances for: {rasters.name}",
+                                disable=not self.show_progress,
+                            )
+                        ]
+                    )
+                for band in group:
+                    # averaged band by band, the same way as in per-channel extraction
+                    reflectances[band] = bands[band][
+                        rows[n_closest_indices], cols[n_closest_indices]
+                    ].mean(axis=1)
+                    coordinates_lists[band] = list(coordinates[n_closest_indices])
 
+        if save_coords:
+            for channel, coordinates_list in zip(rasters.channels, coordinates_lists):
+                self._save_coords(coordinates_list, save_name=channel)
+
+        return reflectances
+
+    @staticmethod
+    def _group_equal_masks(masks):
+        groups = []
+        for band, mask in enumerate(masks):
+            for group in groups:
+                if np.array_equal(masks[group[0]], mask):
+                    group.append(band)
+                    break
+            else:
+                groups.append([band])
+        return groups
+
+    def _extract_reflectances_brute(self, raster, shapefile_df, coordinates, reflectances, n_closest=1):
         reflectance_list = []
         coordinates_list = []
 
         for _, row in track(
-            shapefile_df.iterrows(), description=f"Extracting reflectances for: {raster.name}"
+            shapefile_df.iterrows(),
+            description=f"Extracting reflectances for: {raster.name}",
+            disable=not self.show_progress,
         ):
             row_coord = row[[self.shapefile_X, self.shapefile_Y]].to_numpy().astype(float)
             row_coord = np.expand_dims(row_coord, axis=0)
@@ -73,14 +245,9 @@ class RasterPointsMerger:
                 n_closest=n_closest,
             )
             reflectance_list.append(reflectances[n_closest_indices].mean())
+            coordinates_list.append(coordinates[n_closest_indices])
 
-            if save_coords:
-                coordinates_list.append(coordinates[n_closest_indices])
-
-        if save_coords:
-            self._save_coords(coordinates_list, save_name=raster.name)
-
-        return reflectance_list
+        return reflectance_list, coordinates_list
 
     def _get_closest_distance_indices(self, arr1, arr2, metric="euclidean", n_closest=1):
         dist = distance.cdist(arr1, arr2, metric)
@@ -88,6 +255,81 @@ class RasterPointsMerger:
         # closest_values = np.sort(dist[indices], axis=0)
         return np.sort(indices.flatten())
 
+    def _get_closest_kdtree_indices(self, arr1, arr2, n_closest=1):
+        # tree is built once per raster and queried for all points in a single batched call
+        tree = cKDTree(arr1)
+        _, indices = tree.query(arr2, k=n_closest)
+        indices = indices.reshape(len(arr2), n_closest)
+        return np.sort(indices, axis=1)
+
+    def _extract_reflectances_grid(
+        self,
+        raster: GeotiffRaster | MultiGeotiffRaster,
+        shapefile_df: pd.DataFrame,
+        n_closest=1,
+    ):
+        # reads only small windows around points, the raster is never converted to a DataFrame
+        # for multiple rasters, the windows are stacked, reflectances have shape (channels, points)
+        # and coordinates are listed for each channel
+        points = shapefile_df[[self.shapefile_X, self.shapefile_Y]].to_numpy().astype(float)
+        rows, cols = raster.index(points[:, 0], points[:, 1])
+
+        reflectance_list = []
+        coordinates_list = []
+
+        for point, row, col in track(
+            zip(points, rows, cols),
+            total=len(points),
+            description=f"Extracting reflectances for: {raster.name}",
+            disable=not self.show_progress,
+        ):
+            values, coordinates = self._get_closest_grid_pixels(
+                raster, point, row, col, n_closest=n_closest
+            )
+            reflectance_list.append(values)
+            coordinates_list.append(coordinates)
+
+        return np.array(reflectance_list).T, [list(band) for band in zip(*coordinates_list)]
+
+    def _get_closest_grid_pixels(
+        self, raster: GeotiffRaster | MultiGeotiffRaster, point, row, col, n_closest=1
+    ):
+        height, width = raster.shape
+        pixel_size = min(abs(res) for res in raster.resolution)
+        row, col = int(np.floor(row)), int(np.floor(col))
+        radius = int(np.ceil(np.sqrt(n_closest)))
+
+        while True:
+            row_start, row_stop = max(row - radius, 0), min(row + radius + 1, height)
+            col_start, col_stop = max(col - radius, 0), min(col + radius + 1, width)
+            window = raster.read_window(row_start, row_stop, col_start, col_stop)
+
+            # each band is ranked by its own mask, a single raster is treated as one band
+            masks = raster.valid_mask(window).reshape(-1, *window.shape[-2:])
+            closest, is_complete = [], True
+            for mask in masks:
+                # rank valid (not nodata) pixels in the window by distance to the point
+                window_rows, window_cols = np.nonzero(mask)
+                xs, ys = raster.xy(window_rows + row_start, window_cols + col_start)
+                dist = np.hypot(xs - point[0], ys - point[1])
+                indices = np.argsort(dist, kind="stable")[:n_closest]
+                # pixels outside the window are at least (radius + 0.5) pixels away from the point
+                is_complete &= (
+                    len(indices) == n_closest and dist[indices[-1]] <= (radius + 0.5) * pixel_size
+                )
+                closest.append((window_rows[indices], window_cols[indices], xs[indices], ys[indices]))
+
+            covers_raster = (row_start, col_start, row_stop, col_stop) == (0, 0, height, width)
+            if is_complete or covers_raster:
+                break
+            radius *= 2
+
+        # values are gathered only from the final window, where every band has its closest pixels
+        bands = window.reshape(masks.shape)
+        values = np.array([band[rows, cols].mean() for band, (rows, cols, _, _) in zip(bands, closest)])
+        coordinates = [np.stack([xs, ys], axis=1) for _, _, xs, ys in closest]
+        return values, coordinates
+
     def _save_coords(self, coordinates_list, save_name=""):
         coordinates = np.concatenate(coordinates_list, axis=0)
         coordinates_df = pd.DataFrame(coordinates, columns=[self.shapefile_X, self.shapefile_Y])
@@ -119,7 +361,15 @@ class RasterPointsMerger:
         return self._shapefile.path
 
 
+def _run_merge(merger: RasterPointsMerger):
+    return merger.run_merge()
+
+
 class MultiRasterPointsMerger:
+    BACKEND_THREADS = "threads"
+    BACKEND_PROCESSES = "processes"
+    BACKENDS = (BACKEND_THREADS, BACKEND_PROCESSES)
+
     def __init__(self, merger: list[RasterPointsMerger] = None):
         self._mergers = [] if merger is None else merger
         self._merged_dfs = None
@@ -138,17 +388,35 @@ class MultiRasterPointsMerger:
         self._mergers.extend(mergers)
         return self
 
-    def run_merges(self):
+    def run_merges(self, n_jobs=1, backend=BACKEND_THREADS):
         self._data_column_names = []
         self._merged_dfs = []
-        for merger in self._mergers:
-            merged_df = merger.run_merge()
+        merged_dfs = self._execute_merges(n_jobs=n_jobs, backend=backend)
+        for merger, merged_df in zip(self._mergers, merged_dfs):
             merged_df, new_names = self._change_column_names(
                 merged_df, merger.rasters_name, merger.rasters_channels
             )
             self._data_column_names.extend(new_names)
             self._merged_dfs.append(merged_df)
 
+    def _execute_merges(self, n_jobs=1, backend=BACKEND_THREADS):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Invalid backend: {backend}, possible values are: {self.BACKENDS}")
+
+        if n_jobs == 1:
+            return [merger.run_merge() for merger in self._mergers]
+
+        # progress bars can not be rendered concurrently
+        for merger in self._mergers:
+            merger.show_progress = False
+
+        # 'map' returns results in the order of mergers, so the output is deterministic
+        # note: with processes, mergers are copied to workers (rasters are reopened there from their paths)
+        # and their state is not updated
+        executor = ThreadPoolExecutor if backend == self.BACKEND_THREADS else ProcessPoolExecutor
+        with executor(max_workers=None if n_jobs == -1 else n_jobs) as pool:
+            return list(pool.map(_run_merge, self._mergers))
+
     def _change_column_names(self, merged_df, rasters_name, rasters_channels):
         new_names = [f"{rasters_name}__{channel}" for channel in rasters_channels]
         columns = {old_name: new_name for old_name, new_name in zip(rasters_channels, new_names)}
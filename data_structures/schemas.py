@@ -1,9 +1,13 @@
+import json
 import os
 import pickle
+import struct
 from typing import Type
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pydantic import BaseModel
 from zenml.enums import ArtifactType, VisualizationType
 from zenml.io import fileio
@@ -81,6 +85,84 @@ class RegressionTarget(BaseModel):
         return cls(value=value, name=name)
 
 
+BYTES_MAGIC = b"UAVSD"
+BYTES_VERSION = 1
+METADATA_KEY = b"structured_data"
+
+
+def _frame_to_table(df: pd.DataFrame, metadata: dict | None = None) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    if metadata is not None:
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, METADATA_KEY: json.dumps(metadata)}
+        )
+    return table
+
+
+def _table_to_frame(table: pa.Table) -> tuple[pd.DataFrame, dict | None]:
+    metadata = table.schema.metadata.get(METADATA_KEY)
+    metadata = json.loads(metadata) if metadata is not None else None
+    categorical = [
+        column["name"]
+        for column in table.schema.pandas_metadata["columns"]
+        if column["pandas_type"] == "categorical" and column["name"] in table.column_names
+    ]
+    # arrow buffers are released while converting, so the data is not held in memory twice
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # parquet restores only string dictionaries as categorical, others (e.g. integers) are restored here
+    # note: unused categories of these columns are not preserved
+    df[categorical] = df[categorical].astype("category")
+    return df, metadata
+
+
+def _target_to_frame(target: ClassificationTarget | RegressionTarget) -> tuple[pd.DataFrame, dict]:
+    if isinstance(target, ClassificationTarget):
+        # labels can be tuples of mixed types, so they are stored as json (same as 'to_dict')
+        label = [json.dumps(label) for label in target.label.to_list()]
+        df = pd.DataFrame({"label": label, "value": target.value.to_numpy()}, index=target.value.index)
+        return df, {"encoding": target.encoding.to_list()}
+    return target.value.to_frame("value"), {"name": target.name}
+
+
+def _target_from_frame(df: pd.DataFrame, metadata: dict) -> ClassificationTarget | RegressionTarget:
+    value = df["value"].rename("value")
+    if "name" in metadata:
+        return RegressionTarget(value=value, name=metadata["name"])
+    label = df["label"].map(json.loads).rename("label")
+    encoding = pd.Series(metadata["encoding"], name="encoding")
+    return ClassificationTarget(label=label, value=value, encoding=encoding)
+
+
+def _tables_to_bytes(tables: dict[str, pa.Table]) -> bytes:
+    # layout: magic | header length | json header (version, parts lengths) | arrow ipc streams
+    parts = []
+    for table in tables.values():
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        parts.append(sink.getvalue().to_pybytes())
+    header = {"version": BYTES_VERSION, "parts": {name: len(part) for name, part in zip(tables, parts)}}
+    header = json.dumps(header).encode()
+    return b"".join([BYTES_MAGIC, struct.pack("<I", len(header)), header, *parts])
+
+
+def _tables_from_bytes(data: bytes) -> dict[str, pa.Table]:
+    (header_length,) = struct.unpack_from("<I", data, len(BYTES_MAGIC))
+    offset, end = len(BYTES_MAGIC) + 4, len(BYTES_MAGIC) + 4 + header_length
+    header = json.loads(data[offset:end])
+    if header["version"] > BYTES_VERSION:
+        raise ValueError(f"Unsupported bytes version: {header['version']}, latest is: {BYTES_VERSION}")
+
+    # arrow reads directly from the buffer, without copying it
+    buffer = pa.py_buffer(data)
+    offset = end
+    tables = {}
+    for name, length in header["parts"].items():
+        tables[name] = pa.ipc.open_stream(buffer.slice(offset, length)).read_all()
+        offset += length
+    return tables
+
+
 class StructuredData(BaseModel):
     data: pd.DataFrame
     meta: pd.DataFrame
@@ -100,7 +182,10 @@ class StructuredData(BaseModel):
         }
 
     def to_bytes(self):
-        return pickle.dumps(self.to_dict())
+        tables = {"data": _frame_to_table(self.data), "meta": _frame_to_table(self.meta)}
+        if self.target is not None:
+            tables["target"] = _frame_to_table(*_target_to_frame(self.target))
+        return _tables_to_bytes(tables)
 
     def reset_index(self):
         return StructuredData(
@@ -132,7 +217,14 @@ class StructuredData(BaseModel):
 
     @classmethod
     def from_bytes(cls, data):
-        return cls.from_dict(pickle.loads(data))
+        if not data.startswith(BYTES_MAGIC):
+            # legacy format: pickled 'to_dict' representation
+            return cls.from_dict(pickle.loads(data))
+        tables = _tables_from_bytes(data)
+        data_, _ = _table_to_frame(tables["data"])
+        meta, _ = _table_to_frame(tables["meta"])
+        target = _target_from_frame(*_table_to_frame(tables["target"])) if "target" in tables else None
+        return cls(data=data_, meta=meta, target=target)
 
 
 class StructuredDataMaterializer(BaseMaterializer):
@@ -185,6 +277,32 @@ class StructuredDataMaterializer(BaseMaterializer):
         return metadata
 
 
+class StructuredDataParquetMaterializer(StructuredDataMaterializer):
+    """Data, meta and target are stored as separate Parquet files, which preserves dtypes and indices."""
+
+    def load(self, data_type: Type[StructuredData]) -> StructuredData:
+        data, _ = self._read_parquet(configs.MATERIALIZER_DATA_PARQUET)
+        meta, _ = self._read_parquet(configs.MATERIALIZER_META_PARQUET)
+        target = None
+        if fileio.exists(os.path.join(self.uri, configs.MATERIALIZER_TARGET_PARQUET)):
+            target = _target_from_frame(*self._read_parquet(configs.MATERIALIZER_TARGET_PARQUET))
+        return StructuredData(data=data, meta=meta, target=target)
+
+    def save(self, data: StructuredData) -> None:
+        self._write_parquet(configs.MATERIALIZER_DATA_PARQUET, data.data)
+        self._write_parquet(configs.MATERIALIZER_META_PARQUET, data.meta)
+        if data.target is not None:
+            self._write_parquet(configs.MATERIALIZER_TARGET_PARQUET, *_target_to_frame(data.target))
+
+    def _write_parquet(self, name: str, df: pd.DataFrame, metadata: dict | None = None) -> None:
+        with fileio.open(os.path.join(self.uri, name), mode="wb") as f:
+            pq.write_table(_frame_to_table(df, metadata), f)
+
+    def _read_parquet(self, name: str) -> tuple[pd.DataFrame, dict | None]:
+        with fileio.open(os.path.join(self.uri, name), mode="rb") as f:
+            return _table_to_frame(pq.read_table(f))
+
+
 class Prediction(BaseModel):
     predictions: np.ndarray
     name: str = ""
@@ -196,7 +314,9 @@ class Prediction(BaseModel):
         }
 
     def to_bytes(self):
-        return pickle.dumps(self.to_dict())
+        df = pd.DataFrame({"predictions": self.predictions.ravel()})
+        metadata = {"name": self.name, "shape": list(self.predictions.shape)}
+        return _tables_to_bytes({"predictions": _frame_to_table(df, metadata)})
 
     @classmethod
     def from_dict(cls, data):
@@ -206,4 +326,9 @@ class Prediction(BaseModel):
 
     @classmethod
     def from_bytes(cls, data):
-        return cls.from_dict(pickle.loads(data))
+        if not data.startswith(BYTES_MAGIC):
+            # legacy format: pickled 'to_dict' representation
+            return cls.from_dict(pickle.loads(data))
+        df, metadata = _table_to_frame(_tables_from_bytes(data)["predictions"])
+        predictions = df["predictions"].to_numpy().reshape(metadata["shape"])
+        return cls(predictions=predictions, name=metadata["name"])
@@ -1,11 +1,45 @@
-from functools import wraps
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial, wraps
+from typing import Callable
 
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, SQLModel, create_engine
 
 from configs import configs
 from data_structures.schemas import Prediction, StructuredData
 from database import schemas  # noqa: F401 - needs to be imported for SQLModel to create tables
-from database.schemas import RecordSchema
+from database.schemas import DataSchema, MetricSchema, PredictionSchema, RecordSchema
+
+
+@dataclass(slots=True)
+class ContentView:
+    id: int
+    name: str
+    loader: Callable[[], StructuredData | Prediction] = field(repr=False)
+    _content: StructuredData | Prediction | None = field(default=None, repr=False)
+
+    @property
+    def content(self) -> StructuredData | Prediction:
+        # blob is read from the database and deserialized only on first access
+        if self._content is None:
+            self._content = self.loader()
+        return self._content
+
+
+@dataclass(slots=True)
+class RecordView:
+    id: int
+    model_name: str
+    model_version: str
+    mlflow_uri: str
+    dashboard_url: str
+    is_latest: bool
+    created_at: datetime
+    metrics: list[MetricSchema]
+    # None when records are queried without content
+    data: list[ContentView] | None = None
+    predictions: list[ContentView] | None = None
 
 
 class SQLiteDatabase:
@@ -29,16 +63,37 @@ class SQLiteDatabase:
 
         return decorator
 
-    def _modify_records(self, records: list[RecordSchema]):
+    def _modify_records(self, records: list[RecordSchema], with_content: bool) -> list[RecordView]:
+        views = []
         for record in records:
-            for data in record.data:
-                data.content = StructuredData.from_bytes(data.content)
-            for prediction in record.predictions:
-                prediction.content = Prediction.from_bytes(prediction.content)
-            for metric in record.metrics:
-                # needs to be done because SQLModel throws an exception if the table is not created
-                pass
-        return records
+            view = RecordView(
+                id=record.id,
+                model_name=record.model_name,
+                model_version=record.model_version,
+                mlflow_uri=record.mlflow_uri,
+                dashboard_url=record.dashboard_url,
+                is_latest=record.is_latest,
+                created_at=record.created_at,
+                metrics=list(record.metrics),
+            )
+            if with_content:
+                view.data = [self._content_view(data, StructuredData) for data in record.data]
+                view.predictions = [self._content_view(pred, Prediction) for pred in record.predictions]
+            views.append(view)
+        return views
+
+    def _content_view(self, row: DataSchema | PredictionSchema, content_type: type) -> ContentView:
+        loader = partial(self._get_content, type(row), row.id, content_type)
+        return ContentView(id=row.id, name=row.name, loader=loader)
+
+    @_with_session()
+    def _get_content(
+        self, schema: type[DataSchema | PredictionSchema], content_id: int, content_type: type
+    ) -> StructuredData | Prediction:
+        content = self.session.query(schema.content).filter(schema.id == content_id).scalar()
+        if content is None:
+            raise ValueError(f"Content with id {content_id} not found in {schema.__name__}.")
+        return content_type.from_bytes(content)
 
     @_with_session()
     def save_record(self, record: RecordSchema):
@@ -71,8 +126,23 @@ class SQLiteDatabase:
         self.session.refresh(record)
 
     @_with_session(no_autoflush=True)
-    def get_records(self, model_name: str = None, model_version: str = None, is_latest=None):
-        query = self.session.query(RecordSchema)
+    def get_records(
+        self,
+        model_name: str = None,
+        model_version: str = None,
+        is_latest=None,
+        with_content: bool = True,
+    ) -> list[RecordView]:
+        # related rows are loaded in bulk, content blobs are loaded lazily (see 'ContentView')
+        options = [selectinload(RecordSchema.metrics)]
+        if with_content:
+            options.append(selectinload(RecordSchema.data).load_only(DataSchema.id, DataSchema.name))
+            options.append(
+                selectinload(RecordSchema.predictions).load_only(
+                    PredictionSchema.id, PredictionSchema.name
+                )
+            )
+        query = self.session.query(RecordSchema).options(*options)
         if model_name is not None:
             query = query.filter(RecordSchema.model_name == model_name)
         if model_version is not None:
@@ -80,4 +150,4 @@ class SQLiteDatabase:
         if is_latest is not None:
             query = query.filter(RecordSchema.is_latest == is_latest)
         records = query.all()
-        return self._modify_records(records)
+        return self._modify_records(records, with_content)
@@ -41,7 +41,7 @@ class DBService:
     @record_check
     def create_record(self, model_name: str, model_version: str, record_attrs: RecordAttributes):
         logging.info("Record does not exist. Saving record to database...")
-        records = self.db.get_records(model_name=model_name)
+        records = self.db.get_records(model_name=model_name, with_content=False)
         if records:
             self.db.update_record(model_name=model_name, to_update={"is_latest": False}, is_latest=True)
         record_table = self._create_record_table(
@@ -0,0 +1,169 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.base import BaseEstimator, clone, is_classifier
+from sklearn.model_selection import BaseCrossValidator
+from sklearn.pipeline import Pipeline
+
+# tree methods for which training data can be stored as quantiles, same as in xgboost
+QUANTILE_TREE_METHODS = (None, "auto", "hist", "gpu_hist")
+
+
+@dataclass
+class Fold:
+    """Train / test blocks of a single split, reused by all trials of a study."""
+
+    data_train: np.ndarray
+    target_train: np.ndarray
+    data_test: np.ndarray
+    target_test: np.ndarray
+    _dmatrices: dict = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __getstate__(self):
+        # only data is sent to other processes, matrices are rebuilt there if needed
+        state = self.__dict__.copy()
+        state.update(_dmatrices={}, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def dmatrix(self, estimator: xgb.XGBModel, label: np.ndarray) -> xgb.DMatrix:
+        # quantile sketch of training data is computed once per fold for each 'max_bin'
+        quantile = estimator.tree_method in QUANTILE_TREE_METHODS and estimator.booster != "gblinear"
+        key = (quantile, estimator.max_bin, is_classifier(estimator))
+        with self._lock:
+            if key not in self._dmatrices:
+                if quantile:
+                    matrix = xgb.QuantileDMatrix(
+                        self.data_train,
+                        label=label,
+                        missing=estimator.missing,
+                        max_bin=estimator.max_bin,
+                        nthread=estimator.n_jobs,
+                    )
+                else:
+                    matrix = xgb.DMatrix(
+                        self.data_train, label=label, missing=estimator.missing, nthread=estimator.n_jobs
+                    )
+                self._dmatrices[key] = matrix
+            return self._dmatrices[key]
+
+
+def prepare_folds(validator: BaseCrossValidator, data: pd.DataFrame, target: pd.Series) -> list[Fold]:
+    # data is converted once, each block is contiguous, so fitting does not copy it again
+    data = data.to_numpy(dtype=np.float32)
+    target = target.to_numpy()
+    folds = []
+    for train, test in validator.split(data, target):
+        folds.append(
+            Fold(
+                data_train=np.ascontiguousarray(data[train]),
+                target_train=target[train],
+                data_test=np.ascontiguousarray(data[test]),
+                target_test=target[test],
+            )
+        )
+    return folds
+
+
+def share_folds(folds: list[Fold]) -> tuple[shared_memory.SharedMemory, list[dict]]:
+    # data blocks of all folds are copied once to shared memory, targets are small and sent with the layout
+    blocks = [block for fold in folds for block in (fold.data_train, fold.data_test)]
+    shm = shared_memory.SharedMemory(create=True, size=max(sum(block.nbytes for block in blocks), 1))
+    layout, offset = [], 0
+    for fold in folds:
+        spec = {"target_train": fold.target_train, "target_test": fold.target_test}
+        for name in ("data_train", "data_test"):
+            block = getattr(fold, name)
+            np.ndarray(block.shape, dtype=block.dtype, buffer=shm.buf, offset=offset)[:] = block
+            spec[name] = (offset, block.shape, block.dtype)
+            offset += block.nbytes
+        layout.append(spec)
+    return shm, layout
+
+
+def attach_folds(shm_name: str, layout: list[dict]) -> tuple[shared_memory.SharedMemory, list[Fold]]:
+    # reference to shared memory must be kept, otherwise the buffer is released
+    shm = shared_memory.SharedMemory(name=shm_name)
+    folds = []
+    for spec in layout:
+        blocks = {}
+        for name in ("data_train", "data_test"):
+            offset, shape, dtype = spec[name]
+            blocks[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            blocks[name].flags.writeable = False
+        folds.append(Fold(target_train=spec["target_train"], target_test=spec["target_test"], **blocks))
+    return shm, folds
+
+
+class BoosterModel:
+    """Fitted xgboost booster with only what is needed by scorers."""
+
+    def __init__(self, booster: xgb.Booster, classes: np.ndarray | None = None):
+        self.booster = booster
+        self.classes_ = classes
+        self._estimator_type = "regressor" if classes is None else "classifier"
+
+    def predict_proba(self, data: np.ndarray) -> np.ndarray:
+        proba = self.booster.inplace_predict(data)
+        # binary objectives predict only probability of the positive class
+        return np.column_stack([1 - proba, proba]) if proba.ndim == 1 else proba
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        prediction = self.booster.inplace_predict(data)
+        if self.classes_ is None:
+            return prediction
+        if prediction.ndim == 1 and len(self.classes_) > 2:
+            # 'multi:softmax' objective predicts indices of classes
+            return self.classes_[prediction.astype(int)]
+        return self.classes_[self.predict_proba(data).argmax(axis=1)]
+
+
+def is_booster(estimator: BaseEstimator) -> bool:
+    # random forests of xgboost are excluded, their rounds are not additive
+    return isinstance(estimator, (xgb.XGBClassifier, xgb.XGBRegressor)) and not isinstance(
+        estimator, (xgb.XGBRFClassifier, xgb.XGBRFRegressor)
+    )
+
+
+def train_booster(
+    estimator: xgb.XGBModel, fold: Fold, n_rounds: int, model: BoosterModel | None = None
+) -> BoosterModel:
+    # same parameters as in 'estimator.fit', training is continued from 'model' if given
+    params = estimator.get_xgb_params()
+    classes, label = None, fold.target_train
+    if is_classifier(estimator):
+        classes, label = np.unique(fold.target_train, return_inverse=True)
+        if len(classes) > 2:
+            if params.get("objective") != "multi:softmax":
+                params["objective"] = "multi:softprob"
+            params["num_class"] = len(classes)
+    booster = xgb.train(
+        params,
+        fold.dmatrix(estimator, label),
+        n_rounds,
+        xgb_model=model.booster if model is not None else None,
+    )
+    return BoosterModel(booster, classes)
+
+
+def fit_and_score(model: Pipeline, fold: Fold, scorer) -> float:
+    try:
+        estimator = model.steps[-1][1]
+        if len(model.steps) == 1 and is_booster(estimator):
+            # cached training matrix of the fold is reused instead of sketching the data again
+            fitted = train_booster(estimator, fold, estimator.get_num_boosting_rounds())
+        else:
+            fitted = clone(model).fit(fold.data_train, fold.target_train)
+        return scorer(fitted, fold.data_test, fold.target_test)
+    except Exception as e:
+        # same as 'error_score=0' in 'cross_val_score'
+        logging.warning(f"Fitting failed, score set to 0: {e}")
+        return 0
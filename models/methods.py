@@ -14,13 +14,12 @@ class SavgolWrapper(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X, y=None):
-        signatures_sav = []
-        sp = [self.win_length, self.polyorder, self.deriv]
-        for signal in X:
-            if self.win_length != 0:
-                signal = savgol_filter(signal, sp[0], sp[1], sp[2])
-            signatures_sav.append(signal)
-        return np.array(signatures_sav)
+        # pandas input is used without copying, float32 data stays float32
+        X = np.asarray(X)
+        if self.win_length == 0:
+            return X
+        # all signals (rows) are filtered at once, same as filtering each row separately
+        return savgol_filter(X, self.win_length, self.polyorder, self.deriv, axis=-1)
 
 
 class PLSRegressionWrapper(PLSRegression):
@@ -34,26 +33,35 @@ class PLSRegressionWrapper(PLSRegression):
 class MSCWrapper(BaseEstimator, TransformerMixin):
     """Multiplicative Scatter Correction"""
 
+    def __init__(self, chunk_size=None):
+        # number of rows corrected at once, all rows if not set
+        self.chunk_size = chunk_size
+
     def fit(self, X, y=None):
-        # mean centr correction
-        for i in range(X.shape[0]):
-            X[i, :] -= X[i, :].mean()
-
-        # Get the reference spectrum. If not given, estimate it from the mean
-        reference = None
-        if reference is None:
-            # Calculate mean
-            self.ref = np.mean(X, axis=0)
-        else:
-            self.ref = reference
+        X = np.asarray(X)
+        # reference spectrum is the mean of mean centred spectra, input is not modified
+        ref = np.zeros(X.shape[1])
+        for rows in self._chunks(X.shape[0]):
+            chunk = np.asarray(X[rows], dtype=np.float64)
+            ref += (chunk - chunk.mean(axis=1, keepdims=True)).sum(axis=0)
+        self.ref = ref / X.shape[0]
         return self
 
     def transform(self, X, y=None):
-        # Define a new array and populate it with the corrected data
-        data_msc = np.zeros_like(X)
-        for i in range(X.shape[0]):
-            # Run regression
-            fit = np.polyfit(self.ref, X[i, :], 1, full=True)
-            # Apply correction
-            data_msc[i, :] = (X[i, :] - fit[0][1]) / fit[0][0]
+        X = np.asarray(X)
+        data_msc = np.empty(X.shape, dtype=np.result_type(X.dtype, np.float32))
+        ref_mean = self.ref.mean()
+        ref_centred = self.ref - ref_mean
+        for rows in self._chunks(X.shape[0]):
+            chunk = np.asarray(X[rows], dtype=np.float64)
+            mean = chunk.mean(axis=1, keepdims=True)
+            # least squares fit of all spectra to the reference at once, 'chunk = intercept + slope * ref'
+            slope = ((chunk - mean) @ ref_centred)[:, None] / (ref_centred @ ref_centred)
+            intercept = mean - slope * ref_mean
+            data_msc[rows] = (chunk - intercept) / slope
         return data_msc
+
+    def _chunks(self, n_rows):
+        chunk_size = self.chunk_size or max(n_rows, 1)
+        for start in range(0, n_rows, chunk_size):
+            yield slice(start, start + chunk_size)
@@ -1,5 +1,6 @@
 import logging
 
+from joblib import Memory
 from sklearn.compose import TransformedTargetRegressor
 from sklearn.pipeline import FeatureUnion, Pipeline
 
@@ -7,13 +8,16 @@ from configs import options
 
 
 class Model:
-    def __init__(self, pipeline, unions, target_transformer=None):
+    def __init__(self, pipeline, unions, target_transformer=None, cache_dir=None):
         self.steps = self._create_steps(pipeline, unions)
         self.target_transformer = self._make_step(target_transformer)
+        # fitted transformers are cached by their parameters and training data (i.e. fold),
+        # so trials with unchanged preprocessing do not refit it
+        self.memory = Memory(location=cache_dir, verbose=0) if cache_dir is not None else None
         self.model = None
 
     def create(self):
-        self.model = Pipeline(steps=self.steps)
+        self.model = Pipeline(steps=self.steps, memory=self.memory)
         # if self.target_transformer is not None:
         #     self.model = TransformedTargetRegressor(
         #         regressor=self.model, transformer=self.target_transformer[1]
@@ -1,16 +1,94 @@
+import copy
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 
+import joblib
 import mlflow
+import numpy as np
 import optuna
+from joblib import Parallel, delayed
 from sklearn.base import clone
-from sklearn.model_selection import BaseCrossValidator, cross_val_score
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import BaseCrossValidator
 from sklearn.pipeline import Pipeline
+from threadpoolctl import threadpool_limits
 
 from configs import configs
 from configs.parser import OptimizerConfig
 from data_structures.schemas import StructuredData
 from database import schemas  # noqa: F401 - needs to be imported for SQLModel to create tables
+from models.folds import (
+    Fold,
+    attach_folds,
+    fit_and_score,
+    is_booster,
+    prepare_folds,
+    share_folds,
+    train_booster,
+)
+from utils.utils import set_random_seed
+
+# parameters of estimators which set the number of threads, the first one found is used
+THREAD_PARAMS = ("n_jobs", "nthread", "thread_count")
+
+
+@dataclass(frozen=True)
+class ResourcePlan:
+    trial_jobs: int
+    fold_jobs: int
+    model_threads: int
+
+    @classmethod
+    def from_budget(cls, n_cores: int, trial_jobs: int, fold_jobs: int) -> "ResourcePlan":
+        # cores go to trials first, then to folds, models use the cores left to each fold
+        trial_jobs = max(1, min(trial_jobs, n_cores))
+        fold_jobs = max(1, min(fold_jobs, n_cores // trial_jobs))
+        model_threads = max(1, n_cores // (trial_jobs * fold_jobs))
+        return cls(trial_jobs, fold_jobs, model_threads)
+
+
+def thread_params(model: Pipeline, n_threads: int) -> dict:
+    params = {}
+    for name, step in model.steps:
+        if step is None or step == "passthrough":
+            continue
+        step_params = step.get_params(deep=False)
+        for param in THREAD_PARAMS:
+            if param in step_params:
+                params[f"{name}__{param}"] = n_threads
+                break
+    return params
+
+
+def get_study_storage(storage: str) -> str | optuna.storages.BaseStorage:
+    if storage == configs.STUDY_STORAGE_SQLITE:
+        return f"sqlite:///{configs.DB_PATH}"
+    elif storage == configs.STUDY_STORAGE_JOURNAL:
+        # append-only log file, safe for many processes (and machines) sharing a filesystem
+        return optuna.storages.JournalStorage(
+            optuna.storages.JournalFileStorage(str(configs.STUDY_JOURNAL_PATH))
+        )
+    elif storage == configs.STUDY_STORAGE_MEMORY:
+        return optuna.storages.InMemoryStorage()
+    else:
+        raise ValueError(
+            f"Invalid storage: {storage}, possible values are: "
+            f"{configs.STUDY_STORAGE_SQLITE}, {configs.STUDY_STORAGE_JOURNAL}, {configs.STUDY_STORAGE_MEMORY}"
+        )
+
+
+def _optimize_in_process(optimizer, shm_name, layout, seed):
+    shm, optimizer._folds = attach_folds(shm_name, layout)
+    try:
+        set_random_seed(seed)
+        optimizer.run_worker(seed=seed)
+    finally:
+        # views of shared memory must be released before it is closed
+        optimizer._folds = None
+        shm.close()
 
 
 class Optimizer:
@@ -21,20 +99,49 @@ class Optimizer:
         model: Pipeline,
         validator: BaseCrossValidator,
         optimizer_cfg: OptimizerConfig,
+        pruner: optuna.pruners.BasePruner | None = None,
     ):
         self.data_train = data_train
         self.data_val = data_val  # currently unused
-        self.model = model
         self.validator = validator
         self.optimizer_cfg = optimizer_cfg
+        self.pruner = pruner
+        self.multi_fidelity = optimizer_cfg.multi_fidelity
+        if self.multi_fidelity is not None and pruner is None:
+            # without a pruner every trial is trained in stages to the full budget, which only adds cost
+            raise ValueError(
+                "Invalid pruner: None, multi_fidelity requires a pruner, e.g. HyperbandPruner"
+            )
 
         self.n_trials = optimizer_cfg.n_trials
         self.timeout = optimizer_cfg.timeout
-        self.n_jobs = optimizer_cfg.n_jobs
+        # folds are scored sequentially when trials are pruned
+        incremental = pruner is not None or optimizer_cfg.multi_fidelity is not None
+        fold_jobs = 1 if incremental else optimizer_cfg.fold_n_jobs
+        self.resources = ResourcePlan.from_budget(
+            n_cores=optimizer_cfg.n_cores or os.cpu_count(),
+            trial_jobs=optimizer_cfg.n_jobs,
+            fold_jobs=fold_jobs,
+        )
+        if (self.resources.trial_jobs, self.resources.fold_jobs) != (optimizer_cfg.n_jobs, fold_jobs):
+            logging.warning(
+                f"Jobs limited to the core budget: {self.resources.trial_jobs} trials x "
+                f"{self.resources.fold_jobs} folds x {self.resources.model_threads} model threads"
+            )
+        self.n_jobs = self.resources.trial_jobs
+        # thread params are set on a copy, the passed pipeline is left as it is
+        self.model = clone(model)
+        self.model.set_params(**thread_params(self.model, self.resources.model_threads))
         self.scoring_metric = optimizer_cfg.scoring_metric
         self.scoring_mode = optimizer_cfg.scoring_mode
         self.tuned_params = optimizer_cfg.tuned_parameters
+        self.executor = optimizer_cfg.executor
+        self.storage = optimizer_cfg.storage
+        self.study_name = (
+            optimizer_cfg.study_name or f"trial--{datetime.now().strftime(configs.DATETIME_FORMAT)}"
+        )
 
+        self._folds = None
         self._best_model = None
         self._best_trial = None
 
@@ -48,25 +155,119 @@ class Optimizer:
         logging.info(f"Best {self.scoring_metric}: {self._best_trial.value}")
         logging.info(f"Best hyperparameters found were: {self._best_trial.params}")
 
+    def __getstate__(self):
+        # folds are rebuilt (or attached from shared memory) by each process
+        return {**self.__dict__, "_folds": None}
+
     def _perform_search(self):
+        if (
+            self.executor == configs.TRIAL_EXECUTOR_PROCESS
+            and self.storage == configs.STUDY_STORAGE_MEMORY
+        ):
+            raise ValueError(
+                f"Invalid storage: {self.storage}, possible values for process executor are: "
+                f"{configs.STUDY_STORAGE_SQLITE}, {configs.STUDY_STORAGE_JOURNAL}"
+            )
+        storage = get_study_storage(self.storage)
         study = optuna.create_study(
             direction=self.scoring_mode,
-            storage=f"sqlite:///{configs.DB_PATH}",
-            study_name=f"trial--{datetime.now().strftime(configs.DATETIME_FORMAT)}",
-            # load_if_exists=True,
+            storage=storage,
+            sampler=optuna.samplers.TPESampler(seed=configs.RANDOM_SEED),
+            study_name=self.study_name,
+            pruner=self.pruner if self.pruner is not None else optuna.pruners.NopPruner(),
+            load_if_exists=self.optimizer_cfg.study_name is not None,
         )
-        study.optimize(
-            self._trainable,
-            n_trials=self.n_trials,
-            timeout=self.timeout,
-            n_jobs=self.n_jobs,
-            show_progress_bar=True,
+        if self.storage == configs.STUDY_STORAGE_JOURNAL:
+            # includes training data, so it is saved only for storage meant to be shared by workers
+            path = self.dump_worker()
+            logging.info(f"Additional workers can be started with: python worker.py --study-file {path}")
+
+        if self.executor == configs.TRIAL_EXECUTOR_PROCESS:
+            self._optimize_processes()
+        elif self.executor == configs.TRIAL_EXECUTOR_THREAD:
+            self._optimize(study, self.n_trials)
+        else:
+            raise ValueError(
+                f"Invalid executor: {self.executor}, possible values are: "
+                f"{configs.TRIAL_EXECUTOR_THREAD}, {configs.TRIAL_EXECUTOR_PROCESS}"
+            )
+
+        if self.storage == configs.STUDY_STORAGE_MEMORY:
+            # flushed once at the end, so the study can still be inspected in the Optuna dashboard
+            optuna.copy_study(
+                from_study_name=self.study_name,
+                from_storage=storage,
+                to_storage=get_study_storage(configs.STUDY_STORAGE_SQLITE),
+            )
+        return study
+
+    def _optimize_processes(self):
+        # each process runs trials one by one, so pure python steps are not serialised by the GIL
+        folds = prepare_folds(self.validator, self.data_train.data, self.data_train.target.value)
+        shm, layout = share_folds(folds)
+        del folds
+        worker = copy.copy(self)
+        worker.data_train, worker.n_jobs = None, 1
+        try:
+            with ProcessPoolExecutor(self.n_jobs) as pool:
+                # every worker samples with its own seed, so workers do not suggest identical parameters;
+                # the search is reproducible only for n_jobs=1, otherwise it depends on the order trials finish
+                futures = [
+                    pool.submit(
+                        _optimize_in_process, worker, shm.name, layout, configs.RANDOM_SEED + i + 1
+                    )
+                    for i in range(self.n_jobs)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _optimize(self, study, n_trials):
+        if self._folds is None:
+            # splits are computed once per study (or worker) and shared by all trials
+            self._folds = prepare_folds(
+                self.validator, self.data_train.data, self.data_train.target.value
+            )
+        logging.info(f"Resources: {self.resources}")
+        # limits BLAS / OpenMP pools of numpy, scipy and sklearn, estimator threads are set by 'thread_params'
+        with threadpool_limits(limits=self.resources.model_threads):
+            study.optimize(
+                self._trainable,
+                n_trials=n_trials,
+                timeout=self.timeout,
+                n_jobs=self.n_jobs,
+                # trials of all workers count towards the configured number of trials
+                callbacks=[optuna.study.MaxTrialsCallback(self.n_trials, states=None)],
+                show_progress_bar=n_trials is not None,
+            )
+
+    def dump_worker(self):
+        configs.STUDY_WORKER_DIR.mkdir(parents=True, exist_ok=True)
+        path = configs.STUDY_WORKER_DIR / f"{self.study_name}.joblib"
+        joblib.dump(self, path)
+        return path
+
+    def run_worker(self, n_trials=None, seed=None):
+        # joins the study created by 'run' (possibly in another process) and adds trials to it
+        study = optuna.load_study(
+            study_name=self.study_name,
+            storage=get_study_storage(self.storage),
+            sampler=optuna.samplers.TPESampler(seed=seed),
+            pruner=self.pruner if self.pruner is not None else optuna.pruners.NopPruner(),
         )
+        # 'MaxTrialsCallback' is checked only after a trial, so trials already in the study are counted first
+        remaining = self.n_trials - len(study.trials)
+        if remaining <= 0:
+            logging.info(f"Study {self.study_name} already has {len(study.trials)} trials.")
+            return study
+        self._optimize(study, remaining if n_trials is None else min(n_trials, remaining))
         return study
 
     def _trainable(self, trial):
         params = self._trial_params(trial)
-        score = self._objective(params)
+        score = self._objective(params, trial)
         return score
 
     def _trial_params(self, trial):
@@ -82,31 +283,103 @@ class Optimizer:
 
         return params
 
-    def _objective(self, params):
+    def _objective(self, params, trial=None):
         self.model = clone(self.model)
         self.model.set_params(**params)
+        if self.multi_fidelity is not None and trial is not None:
+            return self._scorer_multi_fidelity(self.model, trial)
+        if self.pruner is not None and trial is not None:
+            return self._scorer_pruned(self.model, trial)
         return self._scorer(self.model)
 
     def _scorer(self, model):
-        score = cross_val_score(
-            model,
-            X=self.data_train.data,
-            y=self.data_train.target.value,
-            groups=None,
-            scoring=self.scoring_metric,
-            cv=self.validator,
-            n_jobs=1,
-            verbose=0,
-            fit_params=None,
-            pre_dispatch=1,
-            error_score=0,
+        scorer = check_scoring(model, scoring=self.scoring_metric)
+        scores = Parallel(n_jobs=self.resources.fold_jobs, pre_dispatch=self.resources.fold_jobs)(
+            delayed(fit_and_score)(model, fold, scorer) for fold in self._folds
         )
-        return score.mean()
+        return np.mean(scores)
+
+    def _scorer_pruned(self, model, trial):
+        # same as '_scorer', but folds are scored one by one and the running mean is reported to the pruner
+        scorer = check_scoring(model, scoring=self.scoring_metric)
+        scores = []
+        for step, fold in enumerate(self._folds):
+            scores.append(fit_and_score(model, fold, scorer))
+            trial.report(np.mean(scores), step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        return np.mean(scores)
+
+    def _scorer_multi_fidelity(self, model, trial):
+        # boosting rounds are added to models of all folds budget by budget, continuing from the rounds already
+        # trained, and the mean score is reported at each budget, so unpromising trials are stopped early
+        step_name, parameter = self.multi_fidelity.parameter.rsplit("__", 1)
+        if step_name != model.steps[-1][0]:
+            raise ValueError(
+                f"Invalid multi_fidelity parameter: {self.multi_fidelity.parameter}, "
+                f"possible values are parameters of: {model.steps[-1][0]}"
+            )
+        estimator = model.steps[-1][1]
+        if not is_booster(estimator):
+            raise ValueError(
+                f"Invalid multi_fidelity estimator: {step_name}, possible values are: XGBClassifier, XGBRegressor"
+            )
+        budgets = self._fidelity_budgets(estimator.get_params()[parameter])
+        scorer = check_scoring(model, scoring=self.scoring_metric)
+
+        folds = [self._transform_fold(model, fold) for fold in self._folds]
+        fitted = [None] * len(folds)
+        trained = 0
+        for budget in budgets:
+            scores = []
+            for i, fold in enumerate(folds):
+                if fold is None:
+                    scores.append(0)
+                    continue
+                try:
+                    fitted[i] = train_booster(estimator, fold, budget - trained, fitted[i])
+                    scores.append(scorer(fitted[i], fold.data_test, fold.target_test))
+                except Exception as e:
+                    # same as 'error_score=0' in '_scorer', the fold is not trained any further
+                    logging.warning(f"Fitting failed, score set to 0: {e}")
+                    folds[i] = None
+                    scores.append(0)
+            trained = budget
+            trial.report(np.mean(scores), budget)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        return np.mean(scores)
+
+    def _fidelity_budgets(self, max_budget):
+        # geometric budgets as in successive halving, the last one is the value suggested for the trial
+        budgets = []
+        budget = self.multi_fidelity.min_resource
+        while budget < max_budget:
+            budgets.append(budget)
+            budget *= self.multi_fidelity.reduction_factor
+        return budgets + [max_budget]
+
+    @staticmethod
+    def _transform_fold(model, fold):
+        # transformers are fitted once per fold, only the last step is trained incrementally
+        if len(model.steps) == 1:
+            return fold
+        try:
+            transformer = clone(model[:-1])
+            return Fold(
+                data_train=transformer.fit_transform(fold.data_train, fold.target_train),
+                target_train=fold.target_train,
+                data_test=transformer.transform(fold.data_test),
+                target_test=fold.target_test,
+            )
+        except Exception as e:
+            logging.warning(f"Fitting failed, score set to 0: {e}")
+            return None
 
     def _refit_model(self, best_params):
         mlflow.sklearn.autolog()
         self._best_model = clone(self.model)
-        self._best_model.set_params(**best_params)
+        self._best_model.set_params(**{**thread_params(self._best_model, os.cpu_count()), **best_params})
         self._best_model.fit(
             self.data_train.data.to_numpy(),
             self.data_train.target.value.to_numpy(),
@@ -4,10 +4,11 @@ from zenml import step
 from configs import configs, options
 from configs.parser import FormatterConfig, GeneralConfig
 from data_manager.loaders import StructuredData
+from data_structures.schemas import StructuredDataParquetMaterializer
 from utils.utils import init_object
 
 
-@step(enable_cache=False)
+@step(enable_cache=False, output_materializers=StructuredDataParquetMaterializer)
 def data_formatter(
     data: StructuredData, general_cfg: GeneralConfig, formatter_cfg: FormatterConfig
 ) -> Annotated[StructuredData, "data"]:
@@ -6,10 +6,10 @@ from zenml import step
 from configs import configs
 from configs.parser import GeneralConfig, MultispectralConfig
 from data_manager.loaders import MultispectralLoader
-from data_structures.schemas import StructuredData, StructuredDataMaterializer
+from data_structures.schemas import StructuredData, StructuredDataParquetMaterializer
 
 
-@step(enable_cache=True, output_materializers=StructuredDataMaterializer)
+@step(enable_cache=True, output_materializers=StructuredDataParquetMaterializer)
 def data_loader(
     general_cfg: GeneralConfig, multispectral_cfg: MultispectralConfig
 ) -> Annotated[StructuredData, "data"]:
@@ -20,5 +20,6 @@ def data_loader(
         save_dir=configs.SAVE_MERGED_DIR,
         save_coords=configs.SAVE_COORDS,
         use_reduced_dataset=configs.USE_REDUCED_DATASET,
+        cache_dir=configs.SAVE_CACHE_DIR if configs.CACHING_REFLECTANCES else None,
     ).load()
     return loader.structured_data
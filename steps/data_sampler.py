@@ -5,10 +5,11 @@ from configs import options
 from configs.parser import SamplerConfig
 from data_manager import samplers
 from data_manager.loaders import StructuredData
+from data_structures.schemas import StructuredDataParquetMaterializer
 from utils.utils import init_object
 
 
-@step(enable_cache=False)
+@step(enable_cache=False, output_materializers=StructuredDataParquetMaterializer)
 def data_sampler(
     data: StructuredData, sampler_cfg: SamplerConfig
 ) -> tuple[
@@ -7,9 +7,10 @@ from zenml import step
 from configs import configs
 from configs.parser import BalancerConfig
 from data_manager.loaders import StructuredData
+from data_structures.schemas import StructuredDataParquetMaterializer
 
 
-@step(enable_cache=False)
+@step(enable_cache=False, output_materializers=StructuredDataParquetMaterializer)
 def features_balancer(
     data_train_feat: StructuredData,
     balancer_cfg: BalancerConfig,
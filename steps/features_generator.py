@@ -4,9 +4,10 @@ from zenml import step
 
 from data_manager.features import FeaturesEngineer
 from data_manager.loaders import StructuredData
+from data_structures.schemas import StructuredDataParquetMaterializer
 
 
-@step(enable_cache=False)
+@step(enable_cache=False, output_materializers=StructuredDataParquetMaterializer)
 def features_generator(
     features_engineer: FeaturesEngineer,
     data_train: StructuredData,
@@ -13,6 +13,7 @@ from models.models import Model
 @step(enable_cache=False, experiment_tracker=Client().active_stack.experiment_tracker.name)
 def model_creator(model_cfg: ModelConfig) -> Annotated[Pipeline, "model"]:
     logging.info("Creating model...")
-    model = Model(model_cfg.pipeline, model_cfg.unions).create()
+    cache_dir = configs.SAVE_PIPELINE_CACHE_DIR if model_cfg.cache_transformers else None
+    model = Model(model_cfg.pipeline, model_cfg.unions, cache_dir=cache_dir).create()
     logging.info(f"Model created: {model}")
     return model
@@ -27,12 +27,18 @@ def model_optimizer(
         optimizer_cfg.validator.validator,
         **optimizer_cfg.validator.params(),
     )
+    pruner = None
+    if optimizer_cfg.pruner is not None:
+        pruner = init_object(
+            options.PRUNERS, optimizer_cfg.pruner.pruner, **optimizer_cfg.pruner.params()
+        )
     optimizer = Optimizer(
         data_train=data_train,
         data_val=data_val,
         model=model,
         validator=validator,
         optimizer_cfg=optimizer_cfg,
+        pruner=pruner,
     )
     optimizer.run()
     return optimizer.best_trial
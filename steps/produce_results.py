@@ -14,8 +14,8 @@ sys.path.insert(0, "..")
 
 from configs import configs
 from data_structures.schemas import ClassificationTarget, Prediction, RegressionTarget, StructuredData
-from database.db import SQLiteDatabase
-from database.schemas import MetricSchema, RecordSchema
+from database.db import RecordView, SQLiteDatabase
+from database.schemas import MetricSchema
 from utils.metrics import (
     ClassificationMetrics,
     RegressionMetrics,
@@ -78,7 +78,7 @@ class Report:
         self._df_clf = pd.DataFrame(columns=pd.MultiIndex.from_tuples(ClassificationColumn.to_list()))
         self._df_reg = pd.DataFrame(columns=pd.MultiIndex.from_tuples(RegressionColumn.to_list()))
 
-    def add_records(self, records: RecordSchema):
+    def add_records(self, records: list[RecordView]):
         for record in records:
             model_name = record.model_name
             model_version = record.model_version
@@ -141,7 +141,7 @@ class Report:
         profile.to_file(save_dir / "profiling_report.html")
 
         write_txt(data.describe().to_string(), save_dir / "describe_data.txt")
-        write_txt(meta.groupby([configs.TREATMENT_ENG, configs.DATE_ENG, configs.BLOCK_ENG, configs.VARIETY_ENG]).size().to_string(), save_dir / "describe_meta.txt")  # type: ignore # noqa
+        write_txt(meta.groupby([configs.TREATMENT_ENG, configs.DATE_ENG, configs.BLOCK_ENG, configs.VARIETY_ENG], observed=True).size().to_string(), save_dir / "describe_meta.txt")  # type: ignore # noqa
         write_txt(data.to_string(), save_dir / "data_data.txt")
         write_txt(meta.to_string(), save_dir / "data_meta.txt")
         write_txt(str(metrics), save_dir / "metrics.txt")
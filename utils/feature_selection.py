@@ -0,0 +1,288 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+from rich import print
+from scipy import linalg
+from sklearn.base import BaseEstimator, TransformerMixin, clone, is_classifier
+from sklearn.linear_model import Ridge, RidgeClassifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import check_cv
+from sklearn.preprocessing import LabelBinarizer
+
+# state of the current process, set once per pool worker (or locally when running sequentially)
+_worker_state = {}
+
+
+def _init_worker(shm_name, shape, dtype, state):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    data = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order="F")
+    # reference to shared memory must be kept, otherwise the buffer is released
+    _worker_state.update(data=data, shm=shm, **state)
+
+
+def _score_subset(subset):
+    return _worker_state["score_func"](list(subset))
+
+
+def _score_subset_refit(subset):
+    data = _worker_state["data"][:, subset]
+    target = _worker_state["target"]
+    scores = []
+    for train, test in _worker_state["splits"]:
+        estimator = clone(_worker_state["estimator"]).fit(data[train], target[train])
+        scores.append(_worker_state["scorer"](estimator, data[test], target[test]))
+    return np.array(scores)
+
+
+def _score_subset_gram(subset):
+    data = _worker_state["data"]
+    target = _worker_state["target"]
+    regularization = _worker_state["alpha"] * np.eye(len(subset))
+    scores = []
+    for test, mean, gram, xty, target_mean in _worker_state["folds"]:
+        # ridge normal equations restricted to the subset, on data centered with the train fold means
+        coef = linalg.solve(
+            gram[np.ix_(subset, subset)] + regularization,
+            xty[subset],
+            assume_a="pos",
+            check_finite=False,
+        )
+        model = _RidgeModel(coef, target_mean - mean[subset] @ coef, _worker_state["classes"])
+        if _worker_state["metric"] is not None:
+            scores.append(
+                _worker_state["metric"](target[test], model.predict(data[np.ix_(test, subset)]))
+            )
+        else:
+            scores.append(_worker_state["scorer"](model, data[np.ix_(test, subset)], target[test]))
+    return np.array(scores)
+
+
+def _neg_mean_squared_error(y_true, y_pred):
+    return -np.mean((y_true - y_pred) ** 2)
+
+
+def _accuracy(y_true, y_pred):
+    return np.mean(y_true == y_pred)
+
+
+def _f1_weighted(y_true, y_pred):
+    labels, encoded = np.unique(np.concatenate([y_true, y_pred]), return_inverse=True)
+    true, pred = np.split(encoded, [len(y_true)])
+    support = np.bincount(true, minlength=len(labels))
+    predicted = np.bincount(pred, minlength=len(labels))
+    true_positives = np.bincount(true[true == pred], minlength=len(labels))
+    # f1 = 2 * tp / (2 * tp + fp + fn), zero for labels which are neither present nor predicted
+    f1 = np.divide(
+        2 * true_positives, support + predicted, out=np.zeros(len(labels)), where=predicted > 0
+    )
+    return np.average(f1, weights=support)
+
+
+# same as sklearn scorers of the same name, without input validation which dominates the scoring time
+METRICS = {
+    "neg_mean_squared_error": _neg_mean_squared_error,
+    "accuracy": _accuracy,
+    "f1_weighted": _f1_weighted,
+}
+
+
+class _RidgeModel:
+    """Fitted Ridge / RidgeClassifier with only what is needed by scorers."""
+
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray, classes: np.ndarray | None = None):
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = classes
+        self._estimator_type = "regressor" if classes is None else "classifier"
+
+    def decision_function(self, data: np.ndarray) -> np.ndarray:
+        scores = data @ self.coef + self.intercept
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        scores = self.decision_function(data)
+        if self.classes is None:
+            return scores
+        # same as in RidgeClassifier: sign for binary problems, argmax otherwise
+        return self.classes[(scores > 0).astype(int) if scores.ndim == 1 else scores.argmax(axis=1)]
+
+
+class SequentialFeatureSelector(BaseEstimator, TransformerMixin):
+    """Sequential forward (floating) feature selection, same algorithm as in mlxtend.
+    Candidate subsets are scored in a process pool, data is shared with workers through shared memory.
+    """
+
+    def __init__(
+        self,
+        estimator: BaseEstimator,
+        k_features: int | tuple[int, int] = 1,
+        floating: bool = False,
+        verbose: int = 0,
+        scoring: str = None,
+        cv: int = 5,
+        n_jobs: int = 1,
+    ):
+        self.estimator = estimator
+        self.k_features = k_features
+        self.floating = floating
+        self.verbose = verbose
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+
+    def fit(self, data, target) -> "SequentialFeatureSelector":
+        data = np.asarray(data)
+        target = np.asarray(target)
+        min_k, max_k = self.k_features if isinstance(self.k_features, tuple) else (self.k_features,) * 2
+        max_k = min(max_k, data.shape[1])
+        if not 1 <= min_k <= max_k:
+            raise ValueError(
+                f"Invalid k_features: {self.k_features}, number of features: {data.shape[1]}"
+            )
+
+        splits = list(
+            check_cv(self.cv, target, classifier=is_classifier(self.estimator)).split(data, target)
+        )
+        state = self._get_worker_state(data, target, splits)
+        self.subsets_ = {}
+
+        if self.n_jobs == 1:
+            # column major, so selecting subsets of features is cheap
+            _worker_state.update(data=np.asfortranarray(data), **state)
+            try:
+                self._select(data.shape[1], max_k, map)
+            finally:
+                _worker_state.clear()
+        else:
+            # data is copied once to shared memory, workers only receive indices of candidate features
+            shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+            try:
+                np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf, order="F")[:] = data
+                n_workers = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+                init_args = (shm.name, data.shape, data.dtype, state)
+                with ProcessPoolExecutor(
+                    n_workers, initializer=_init_worker, initargs=init_args
+                ) as pool:
+                    chunksize = max(1, data.shape[1] // (4 * n_workers))
+                    self._select(data.shape[1], max_k, partial(pool.map, chunksize=chunksize))
+            finally:
+                shm.close()
+                shm.unlink()
+
+        # the smallest subset with the best score within range is selected
+        subsets = {k: subset for k, subset in self.subsets_.items() if min_k <= k <= max_k}
+        k_best = max(subsets, key=lambda k: (subsets[k]["avg_score"], -k))
+        self.k_feature_idx_ = subsets[k_best]["feature_idx"]
+        self.k_score_ = subsets[k_best]["avg_score"]
+        return self
+
+    def _get_worker_state(self, data: np.ndarray, target: np.ndarray, splits: list) -> dict:
+        return {
+            "score_func": _score_subset_refit,
+            "target": target,
+            "estimator": self.estimator,
+            "scorer": get_scorer(self.scoring),
+            "splits": splits,
+        }
+
+    def _select(self, n_features: int, max_k: int, map_func):
+        selected = ()
+        while len(selected) < max_k:
+            candidates = [
+                selected + (feature,) for feature in range(n_features) if feature not in selected
+            ]
+            selected, score, cv_scores = self._best_subset(candidates, map_func)
+            new_feature = selected[-1]
+            self._update_subsets(selected, score, cv_scores)
+
+            # floating: remove features while it improves the best score of the smaller subset
+            while self.floating and len(selected) > 2:
+                candidates = [
+                    tuple(f for f in selected if f != feature)
+                    for feature in selected
+                    if feature != new_feature
+                ]
+                reduced, reduced_score, reduced_cv_scores = self._best_subset(candidates, map_func)
+                if reduced_score <= score or reduced_score <= self.subsets_[len(reduced)]["avg_score"]:
+                    break
+                selected, score = reduced, reduced_score
+                self._update_subsets(selected, score, reduced_cv_scores)
+
+    def _best_subset(self, candidates: list[tuple[int, ...]], map_func):
+        # 'map' keeps order of candidates, so ties are resolved the same way for any 'n_jobs'
+        all_cv_scores = list(map_func(_score_subset, candidates))
+        avg_scores = [np.nanmean(cv_scores) for cv_scores in all_cv_scores]
+        best = int(np.argmax(avg_scores))
+        return candidates[best], avg_scores[best], all_cv_scores[best]
+
+    def _update_subsets(self, selected: tuple[int, ...], score: float, cv_scores: np.ndarray):
+        k = len(selected)
+        if k not in self.subsets_ or score > self.subsets_[k]["avg_score"]:
+            self.subsets_[k] = {
+                "feature_idx": tuple(sorted(selected)),
+                "cv_scores": cv_scores,
+                "avg_score": score,
+            }
+        if self.verbose:
+            print(f"Features: {k}/{self.k_features} -- score: {score}")
+
+    def transform(self, data):
+        return np.asarray(data)[:, list(self.k_feature_idx_)]
+
+    def get_metric_dict(self) -> dict[int, dict]:
+        metric_dict = {}
+        for k, subset in self.subsets_.items():
+            cv_scores = subset["cv_scores"]
+            std_dev = np.std(cv_scores)
+            std_err = std_dev / math.sqrt(max(len(cv_scores) - 1, 1))
+            metric_dict[k] = {**subset, "std_dev": std_dev, "std_err": std_err}
+        return metric_dict
+
+
+class RidgeSequentialFeatureSelector(SequentialFeatureSelector):
+    """Sequential feature selection for Ridge and RidgeClassifier estimators.
+    Gram matrices are computed once per fold, so scoring a candidate subset only solves a small linear system
+    instead of fitting the estimator.
+    """
+
+    def _get_worker_state(self, data: np.ndarray, target: np.ndarray, splits: list) -> dict:
+        if not isinstance(self.estimator, (Ridge, RidgeClassifier)):
+            raise ValueError(
+                f"Invalid estimator: {self.estimator}, possible values are: Ridge, RidgeClassifier"
+            )
+        params = self.estimator.get_params()
+
+        if isinstance(self.estimator, RidgeClassifier):
+            # same encoding as in RidgeClassifier
+            binarizer = LabelBinarizer(pos_label=1, neg_label=-1)
+            targets = binarizer.fit_transform(target).astype(np.float64)
+            classes = binarizer.classes_
+        else:
+            targets = target.reshape(len(target), -1).astype(np.float64)
+            classes = None
+
+        folds = []
+        for train, test in splits:
+            data_train = data[train].astype(np.float64)
+            targets_train = targets[train]
+            mean = data_train.mean(axis=0) if params["fit_intercept"] else np.zeros(data.shape[1])
+            target_mean = (
+                targets_train.mean(axis=0) if params["fit_intercept"] else np.zeros(targets.shape[1])
+            )
+            data_train -= mean
+            xty = data_train.T @ (targets_train - target_mean)
+            folds.append((test, mean, data_train.T @ data_train, xty, target_mean))
+
+        return {
+            "score_func": _score_subset_gram,
+            "target": target,
+            "alpha": params["alpha"],
+            "classes": classes,
+            "scorer": get_scorer(self.scoring),
+            "metric": METRICS.get(self.scoring),
+            "folds": folds,
+        }
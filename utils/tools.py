@@ -1,10 +1,10 @@
+from functools import lru_cache
 from types import SimpleNamespace
 from typing import Callable, Iterable, Literal
 
 import numpy as np
 import pandas as pd
 import spyndex
-from mlxtend.feature_selection import SequentialFeatureSelector as SFS
 from rich import print
 from scipy.stats import bootstrap
 from sklearn.linear_model import Ridge, RidgeClassifier
@@ -13,6 +13,7 @@ from sklearn.preprocessing import RobustScaler
 
 from configs import configs
 from configs.constants import SPECTRAL_INDICES
+from utils.feature_selection import RidgeSequentialFeatureSelector as SFS
 
 
 def calculate_confidence_interval(
@@ -47,29 +48,82 @@ def calculate_metric_and_confidence_interval(
     return SimpleNamespace(mean=mean, ci=ci)
 
 
-def compute_indices(data: pd.DataFrame) -> pd.DataFrame:
+class SpectralIndicesEngine:
+    """Computes spectral indices with numpy, formulas are taken from spyndex and compiled only once.
+    Specific to this particular project and dataset (see 'compute_indices').
+    """
+
+    # spyndex band parameter -> data column
+    BANDS = {
+        configs.BAND_BLUE_S: configs.BAND_BLUE,
+        configs.BAND_GREEN_S1: configs.BAND_GREEN,
+        configs.BAND_GREEN_S2: configs.BAND_GREEN,
+        configs.BAND_RED_S: configs.BAND_RED,
+        configs.BAND_RED_EDGE_S1: configs.BAND_RED_EDGE,
+        configs.BAND_RED_EDGE_S2: configs.BAND_RED_EDGE,
+        configs.BAND_RED_EDGE_S3: configs.BAND_RED_EDGE,
+        configs.BAND_NIR_S1: configs.BAND_NIR,
+        configs.BAND_NIR_S2: configs.BAND_NIR,
+    }
+
+    def __init__(self, indices: Iterable[str] = SPECTRAL_INDICES, dtype: type = np.float32):
+        self.indices = list(indices)
+        self.dtype = dtype
+        self.columns = list(dict.fromkeys(self.BANDS.values()))
+        self.kernels = [self._compile(index) for index in self.indices]
+
+    def _compile(self, index: str):
+        if index not in spyndex.indices:
+            raise ValueError(
+                f"Invalid spectral index: {index}, possible values are: {list(spyndex.indices)}"
+            )
+        missing = set(spyndex.indices[index].bands) - set(self.BANDS)
+        if missing:
+            raise ValueError(
+                f"Spectral index {index} requires parameters which are not available: {missing}"
+            )
+        return compile(spyndex.indices[index].formula, index, "eval")
+
+    def compute(self, data: pd.DataFrame, chunk_size: int | None = None) -> pd.DataFrame:
+        # one contiguous row per band, so each band is a contiguous vector
+        bands = np.ascontiguousarray(data[self.columns].to_numpy(dtype=self.dtype).T)
+        rows = bands.shape[1]
+        chunk_size = chunk_size or max(rows, 1)
+
+        result = np.empty((rows, len(self.indices)), dtype=self.dtype)
+        # division by zero and similar are expected, such indices are dropped in 'compute_indices'
+        with np.errstate(all="ignore"):
+            for start in range(0, rows, chunk_size):
+                chunk = slice(start, start + chunk_size)
+                params = {
+                    param: bands[self.columns.index(column), chunk]
+                    for param, column in self.BANDS.items()
+                }
+                for i, kernel in enumerate(self.kernels):
+                    result[chunk, i] = eval(kernel, {"__builtins__": {}}, params)
+        return pd.DataFrame(result, index=data.index, columns=self.indices)
+
+
+@lru_cache(maxsize=None)
+def get_spectral_indices_engine(
+    indices: tuple[str, ...] = tuple(SPECTRAL_INDICES)
+) -> SpectralIndicesEngine:
+    return SpectralIndicesEngine(indices)
+
+
+def compute_indices(
+    data: pd.DataFrame, chunk_size: int | None = configs.INDICES_CHUNK_SIZE
+) -> pd.DataFrame:
     """Specific to this particular project and dataset.
     Spectral indices were chosen based on multispectral sensor used (micasense RedEdge-MX)
     """
-    df = spyndex.computeIndex(
-        index=SPECTRAL_INDICES,
-        params={
-            configs.BAND_BLUE_S: data[configs.BAND_BLUE],
-            configs.BAND_GREEN_S1: data[configs.BAND_GREEN],
-            configs.BAND_GREEN_S2: data[configs.BAND_GREEN],
-            configs.BAND_RED_S: data[configs.BAND_RED],
-            configs.BAND_RED_EDGE_S1: data[configs.BAND_RED_EDGE],
-            configs.BAND_RED_EDGE_S2: data[configs.BAND_RED_EDGE],
-            configs.BAND_RED_EDGE_S3: data[configs.BAND_RED_EDGE],
-            configs.BAND_NIR_S1: data[configs.BAND_NIR],
-            configs.BAND_NIR_S2: data[configs.BAND_NIR],
-        },
-    )
+    df = get_spectral_indices_engine().compute(data, chunk_size=chunk_size)
+    values = df.to_numpy()
     # Drop columns with inf or NaN values
-    df = df.drop(df.columns[df.isin([np.inf, -np.inf, np.nan]).any()], axis=1)
+    finite = np.isfinite(values).all(axis=0)
     # Drop columns with constant values
-    df = df.drop(df.columns[df.nunique() == 1], axis=1)
-    return df
+    constant = (values == values[:1]).all(axis=0) & (len(values) > 0)
+    return df.loc[:, finite & ~constant]
 
 
 def feature_selector_factory(
@@ -88,8 +142,7 @@ def feature_selector_factory(
         )
     sfs = SFS(
         estimator=algo,
-        k_features=(1, 20),  # type: ignore # noqa # can be: "best" - most extensive, (1, n) - check range of features, n - exact number of features
-        forward=True,  # selection in forward direction
+        k_features=(1, 20),  # type: ignore # noqa # can be: (1, n) - check range of features, n - exact number of features
         floating=True,  # floating algorithm - can go back and remove features once added
         verbose=verbose,
         scoring=scoring,
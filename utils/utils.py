@@ -1,7 +1,9 @@
+import hashlib
 import json
 import pickle
 import random
 from collections import OrderedDict
+from functools import partial
 from itertools import repeat
 from pathlib import Path
 
@@ -53,6 +55,15 @@ def read_pickle(fname):
         return pickle.load(f)
 
 
+def hash_files(fnames, chunk_size=2**20):
+    hasher = hashlib.sha256()
+    for fname in fnames:
+        with Path(fname).open("rb") as handle:
+            for chunk in iter(partial(handle.read, chunk_size), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 def save_image(file_name, image, metadata=None):
     sp.envi.save_image(file_name, image, dtype=np.float32, metadata=metadata, force=True)
 
@@ -0,0 +1,36 @@
+import click
+import joblib
+
+from configs import configs
+
+
+@click.command()
+@click.option(
+    "--study-file",
+    "-s",
+    required=True,
+    type=click.Path(exists=True),
+    help=f"Study file saved by the optimizer, located in '{configs.STUDY_WORKER_DIR}'.",
+)
+@click.option(
+    "--n-trials",
+    "-n",
+    default=None,
+    type=int,
+    help=(
+        "Maximum number of trials run by this worker. It stops when the study reaches the configured number "
+        "of trials, trials already running in other workers may still exceed it slightly."
+    ),
+)
+def worker(study_file: str, n_trials: int | None):
+    optimizer = joblib.load(study_file)
+    if optimizer.storage == configs.STUDY_STORAGE_MEMORY:
+        raise ValueError(
+            f"Invalid storage: {optimizer.storage}, possible values are: "
+            f"{configs.STUDY_STORAGE_SQLITE}, {configs.STUDY_STORAGE_JOURNAL}"
+        )
+    optimizer.run_worker(n_trials)
+
+
+if __name__ == "__main__":
+    worker()